@@ -0,0 +1,31 @@
+"""Import-time budget for `import template_models`.
+
+The budget (seconds) can be overridden with TEMPLATE_MODELS_IMPORT_BUDGET.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+IMPORT_BUDGET = float(os.environ.get("TEMPLATE_MODELS_IMPORT_BUDGET", "0.5"))
+
+CODE = (
+    "import time; start = time.perf_counter(); import template_models;"
+    "print(time.perf_counter() - start)"
+)
+
+
+def import_time() -> float:
+    out = subprocess.run([sys.executable, "-c", CODE], capture_output=True, text=True, check=True)
+    return float(out.stdout)
+
+
+def test_import_time(benchmark):
+    times = []
+    benchmark.pedantic(lambda: times.append(import_time()), rounds=5, iterations=1)
+    assert statistics.median(times) < IMPORT_BUDGET
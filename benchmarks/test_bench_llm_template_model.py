@@ -0,0 +1,32 @@
+"""Offline benchmarks for the LLMTemplateModel path, using a stub client."""
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from template_models.llm_template_model import LLMTemplateModel
+
+TEMPLATE = "Name:<#name|str|This is the name field#> Age:<#age|int|This is the age field#>"
+
+
+class StubClient:
+    """Instructor stand-in that parses "name,age" queries without a network call."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages, response_model, **kwargs):
+        name, age = messages[-1]["content"].split(",")
+        return response_model(name=name, age=age)
+
+
+def test_generate_instance(benchmark):
+    text_generator = LLMTemplateModel(TEMPLATE)
+    benchmark(text_generator.generate_instance, "Jay,30", llm=StubClient())
+
+
+def test_generate_text(benchmark):
+    text_generator = LLMTemplateModel(TEMPLATE)
+    benchmark(text_generator.generate_text, "Jay,30", llm=StubClient())
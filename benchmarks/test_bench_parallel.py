@@ -0,0 +1,33 @@
+"""Throughput of render_parallel against single-process get_texts."""
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from template_models.template_model import TemplateModel
+
+from .test_bench_template_model import make_row, make_template
+
+N_FIELDS = 20
+N_ROWS = 50_000
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return [make_row(N_FIELDS, i) for i in range(N_ROWS)]
+
+
+def test_get_texts_single_process(benchmark, rows):
+    text_generator = TemplateModel(make_template(N_FIELDS))
+    benchmark.pedantic(text_generator.get_texts, args=(rows,), rounds=3, iterations=1)
+
+
+@pytest.mark.parametrize("workers", [1, 2, 4])
+def test_render_parallel(benchmark, rows, workers):
+    text_generator = TemplateModel(make_template(N_FIELDS))
+
+    def run():
+        for _ in text_generator.render_parallel(rows, workers=workers, chunksize=2000):
+            pass
+
+    benchmark.pedantic(run, rounds=3, iterations=1)
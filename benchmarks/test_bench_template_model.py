@@ -0,0 +1,163 @@
+"""Benchmarks for TemplateModel model construction, validation and rendering.
+
+Run with `make bench`, which writes the results to bench_output.json.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from pydantic import BaseModel, Field, create_model
+
+from template_models.template_model import TemplateModel
+
+FIELD_COUNTS = [3, 50, 500]
+SUBSTITUTION_COUNTS = [0, 10, 100]
+N_ROWS = 1000
+
+
+def make_template(n_fields: int, n_subs: int = 0) -> str:
+    subs = " ".join(f"{{s{j}}}" for j in range(n_subs))
+    fields = " ".join(f"F{i}:<#f{i}|int|Field number {i}#>" for i in range(n_fields))
+    return f"{subs} {fields}"
+
+
+def make_subs(n_subs: int) -> dict[str, str]:
+    return {f"s{j}": f"value{j}" for j in range(n_subs)}
+
+
+def make_row(n_fields: int, value: int = 1) -> dict[str, int]:
+    return {f"f{i}": value for i in range(n_fields)}
+
+
+@pytest.mark.parametrize("n_fields", FIELD_COUNTS)
+def test_get_model_cold(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields), class_name="Bench")
+    benchmark.pedantic(
+        text_generator.get_model, setup=TemplateModel.clear_cache, rounds=20, iterations=1
+    )
+
+
+@pytest.mark.parametrize("n_fields", FIELD_COUNTS)
+def test_get_model_warm(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields), class_name="Bench")
+    text_generator.get_model()
+    benchmark(text_generator.get_model)
+
+
+@pytest.mark.parametrize("n_subs", SUBSTITUTION_COUNTS)
+def test_get_model_substitutions(benchmark, n_subs):
+    text_generator = TemplateModel(make_template(10, n_subs), delayed_substitution=True)
+    subs = make_subs(n_subs)
+    text_generator.get_model(substitutions=subs)
+    benchmark(text_generator.get_model, substitutions=subs)
+
+
+@pytest.mark.parametrize("n_fields", FIELD_COUNTS)
+def test_get_instance(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    row = make_row(n_fields)
+    benchmark(text_generator.get_instance, row)
+
+
+@pytest.mark.parametrize("n_fields", FIELD_COUNTS)
+def test_get_text(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    row = make_row(n_fields)
+    benchmark(text_generator.get_text, row)
+
+
+@pytest.mark.parametrize("n_subs", SUBSTITUTION_COUNTS)
+def test_get_text_substitutions(benchmark, n_subs):
+    text_generator = TemplateModel(make_template(10, n_subs), delayed_substitution=True)
+    subs = make_subs(n_subs)
+    row = make_row(10)
+    benchmark(text_generator.get_text, row, substitutions=subs)
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_get_text_loop(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    rows = [make_row(n_fields, i) for i in range(N_ROWS)]
+    benchmark(lambda: [text_generator.get_text(row) for row in rows])
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_get_texts_batched(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    rows = [make_row(n_fields, i) for i in range(N_ROWS)]
+    benchmark(text_generator.get_texts, rows)
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_get_texts_trusted(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    rows = [make_row(n_fields, i) for i in range(N_ROWS)]
+    benchmark(text_generator.get_texts, rows, validate=False)
+
+
+@pytest.mark.parametrize("n_fields", FIELD_COUNTS)
+def test_get_text_from_dict(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    row = make_row(n_fields)
+    benchmark(text_generator.get_text_from_dict, row)
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_get_texts_json_loads(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    lines = [json.dumps(make_row(n_fields, i)).encode() for i in range(N_ROWS)]
+    benchmark(lambda: text_generator.get_texts([json.loads(line) for line in lines]))
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_get_texts_from_jsonl(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    data = b"\n".join(json.dumps(make_row(n_fields, i)).encode() for i in range(N_ROWS))
+    benchmark(text_generator.get_texts_from_jsonl, data)
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_to_columns_render_columns(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    rows = [make_row(n_fields, i) for i in range(N_ROWS)]
+    benchmark(lambda: text_generator.render_columns(text_generator.to_columns(rows)))
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_parse_text(benchmark, n_fields):
+    text_generator = TemplateModel(make_template(n_fields))
+    text = text_generator.get_text(make_row(n_fields))
+    benchmark(text_generator.parse_text, text)
+
+
+@pytest.mark.parametrize("n_threads", [1, 4])
+def test_get_texts_frozen_threads(benchmark, n_threads):
+    """Scales with threads on a free-threaded (no-GIL) build; flat with the GIL."""
+    text_generator = TemplateModel(make_template(3)).freeze()
+    rows = [make_row(3, i) for i in range(N_ROWS)]
+    with ThreadPoolExecutor(n_threads) as pool:
+        benchmark(lambda: list(pool.map(text_generator.get_texts, [rows] * 4)))
+
+
+@pytest.mark.parametrize("n_fields", [3, 50])
+def test_basemodel_baseline(benchmark, n_fields):
+    """Hand-written equivalent: a static model and an f-string style join."""
+    Model: type[BaseModel] = create_model(  # type: ignore
+        "Bench",
+        **{f"f{i}": (int, Field(..., description=f"Field number {i}")) for i in range(n_fields)},
+    )
+    names = list(Model.model_fields)
+    rows = [make_row(n_fields, i) for i in range(N_ROWS)]
+
+    def render():
+        out = []
+        for row in rows:
+            instance = Model(**row)
+            out.append(" " + " ".join(f"F{i}:{getattr(instance, n)}" for i, n in enumerate(names)))
+        return out
+
+    benchmark(render)
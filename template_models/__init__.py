@@ -1,8 +1,19 @@
+from typing import TYPE_CHECKING, Any
+
+from template_models.registry import TemplateRegistry
+from template_models.template_index import TemplateIndex
 from template_models.template_model import TemplateModel
-from template_models.llm_template_model import LLMTemplateModel
-__all__ = ["TemplateModel", "LLMTemplateModel"]
-# try:
 
-#     __all__ = ["TemplateModel", "LLMTemplateModel"]
-# except ImportError:
-#     __all__ = ["TemplateModel"]
+if TYPE_CHECKING:
+    from template_models.llm_template_model import LLMTemplateModel
+
+__all__ = ["TemplateModel", "LLMTemplateModel", "TemplateRegistry", "TemplateIndex"]
+
+
+def __getattr__(name: str) -> Any:
+    ## Loaded lazily so plain TemplateModel users don't import the LLM stack
+    if name == "LLMTemplateModel":
+        from template_models.llm_template_model import LLMTemplateModel
+
+        return LLMTemplateModel
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import asyncio
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Optional
+
+## Provider SDKs are imported on first use so importing template_models stays cheap
+if TYPE_CHECKING:
+    from qrev_instructor import APIType
+
+
+class ClientPool:
+    """Process-wide registry of instructor clients.
+
+    One provider client (and therefore one keep-alive connection pool) is kept per
+    provider and sync/async flavour, and shared by the instructor clients built for
+    every model name served by that provider.
+    Args:
+        pool_size: Maximum number of connections per provider client. None keeps the provider default.
+        timeout: Request timeout in seconds. None keeps the provider default.
+        client_params: Extra keyword arguments for the provider client (api_key, base_url, ...).
+    """
+
+    def __init__(
+        self,
+        pool_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        client_params: Optional[dict[str, Any]] = None,
+    ):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.client_params = client_params or {}
+        self._lock = Lock()
+        self._raw_clients: dict[tuple[APIType, bool], Any] = {}
+        self._clients: dict[tuple[APIType, str, bool], Any] = {}
+
+    def get(self, model_name: str, asynchronous: bool = False) -> Any:
+        """Return the pooled instructor client for `model_name`."""
+        from qrev_instructor import get_api_service
+
+        api = get_api_service(model_name)
+        key = (api, model_name, asynchronous)
+        client = self._clients.get(key)
+        if client is not None:
+            return client
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                raw_key = (api, asynchronous)
+                raw = self._raw_clients.get(raw_key)
+                if raw is None:
+                    raw = self._raw_clients[raw_key] = self._make_raw_client(api, asynchronous)
+                client = self._clients[key] = wrap_client(raw, api)
+            return client
+
+    def _make_raw_client(self, api: APIType, asynchronous: bool) -> Any:
+        from qrev_instructor import APIType
+
+        params = dict(self.client_params)
+        if self.timeout is not None:
+            params.setdefault("timeout", self.timeout)
+        if self.pool_size is not None:
+            params.setdefault("http_client", self._make_http_client(asynchronous))
+
+        if api == APIType.ANTHROPIC:
+            from anthropic import Anthropic, AsyncAnthropic
+
+            return (AsyncAnthropic if asynchronous else Anthropic)(**params)
+        from openai import AsyncOpenAI, OpenAI
+
+        return (AsyncOpenAI if asynchronous else OpenAI)(**params)
+
+    def _make_http_client(self, asynchronous: bool) -> Any:
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=self.pool_size, max_keepalive_connections=self.pool_size
+        )
+        client_cls = httpx.AsyncClient if asynchronous else httpx.Client
+        return client_cls(limits=limits, timeout=self.timeout)
+
+    def close(self) -> None:
+        """Close every provider client and forget every pooled client.
+        Async clients are closed on a temporary event loop. From inside a running event
+        loop that isn't possible, so a pool holding async clients raises RuntimeError
+        there; use `await pool.aclose()` instead.
+        """
+        with self._lock:
+            if any(asynchronous for _, asynchronous in self._raw_clients) and _loop_running():
+                raise RuntimeError(
+                    "ClientPool.close() can't close async clients from a running event loop, "
+                    "use `await pool.aclose()` instead"
+                )
+            raw_clients = list(self._raw_clients.items())
+            self._raw_clients.clear()
+            self._clients.clear()
+        for (_, asynchronous), raw in raw_clients:
+            if asynchronous:
+                asyncio.run(raw.close())
+            else:
+                raw.close()
+
+    async def aclose(self) -> None:
+        """Close every provider client, including async ones."""
+        with self._lock:
+            raw_clients = list(self._raw_clients.items())
+            self._raw_clients.clear()
+            self._clients.clear()
+        for (_, asynchronous), raw in raw_clients:
+            if asynchronous:
+                await raw.close()
+            else:
+                raw.close()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+def _loop_running() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def wrap_client(raw: Any, api: Optional[APIType] = None) -> Any:
+    """Patch a raw provider client with instructor."""
+    from qrev_instructor import APIType, instructor
+
+    if api is None:
+        api = APIType.ANTHROPIC if "anthropic" in raw.__class__.__name__.lower() else APIType.OPENAI
+    if api == APIType.ANTHROPIC:
+        return instructor.from_anthropic(raw)
+    return instructor.from_openai(raw)
+
+
+default_client_pool = ClientPool()
@@ -0,0 +1,184 @@
+"""Columnar validation and rendering for bulk jobs.
+
+Rows are validated through a TypedDict with the template's field types, so pydantic
+coerces them into plain dicts instead of model instances, and the values are appended
+to one buffer per field: `array.array` for `int` ("q") and `float` ("d") fields, lists
+for everything else (and for int columns once a value doesn't fit 64 bits). Memory use is then one machine value per int/float cell rather
+than one BaseModel per row. `to_arrow` turns the columns into a `pyarrow.Table`
+(the numeric ones without copying) when pyarrow is installed.
+"""
+
+from array import array
+from functools import lru_cache
+from itertools import islice, repeat
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, Mapping, Optional, Union
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from typing_extensions import TypedDict
+
+from .compiled_template import FieldSlot
+
+if TYPE_CHECKING:
+    import pyarrow
+
+    from .template_model import JsonLines, TemplateModel
+
+Column = Union[array, list]
+
+## array.array typecodes for field types with a fixed-size machine representation
+ARRAY_TYPECODES: dict[Any, str] = {int: "q", float: "d"}
+
+
+@lru_cache(maxsize=256)
+def get_row_adapters(model: type[BaseModel]) -> tuple[TypeAdapter, TypeAdapter]:
+    """TypeAdapters validating one row and a list of rows into plain dicts with `model`'s fields."""
+    row_type = TypedDict(  # type: ignore
+        f"{model.__name__}Row",
+        {name: info.rebuild_annotation() for name, info in model.model_fields.items()},
+    )
+    return TypeAdapter(row_type), TypeAdapter(list[row_type])  # type: ignore
+
+
+def new_columns(model: type[BaseModel]) -> dict[str, Column]:
+    """Empty column buffers for `model`'s fields."""
+    columns: dict[str, Column] = {}
+    for name, info in model.model_fields.items():
+        typecode = ARRAY_TYPECODES.get(info.annotation)
+        columns[name] = array(typecode) if typecode else []
+    return columns
+
+
+def _append(columns: dict[str, Column], rows: list[dict[str, Any]]) -> None:
+    ## Convert the whole batch before any column grows, so the columns stay aligned
+    converted: dict[str, Column] = {}
+    for name, column in list(columns.items()):
+        values: Column = [row[name] for row in rows]
+        if isinstance(column, array):
+            try:
+                values = array(column.typecode, values)
+            except OverflowError:
+                ## Pydantic ints are unbounded; keep values that don't fit 64 bits in a list
+                columns[name] = list(column)
+        converted[name] = values
+    for name, values in converted.items():
+        columns[name].extend(values)  # type: ignore
+
+
+def validate_columns(
+    model: type[BaseModel],
+    rows: Iterable[dict[str, Any]],
+    errors: Optional[list[tuple[int, ValidationError]]] = None,
+    batch_size: int = 1024,
+) -> dict[str, Column]:
+    """See `TemplateModel.to_columns`."""
+    row_adapter, list_adapter = get_row_adapters(model)
+    columns = new_columns(model)
+    offset = 0
+    it = iter(rows)
+    while batch := list(islice(it, batch_size)):
+        try:
+            _append(columns, list_adapter.validate_python(batch))
+        except ValidationError:
+            ## Fall back to per-row validation so one bad row doesn't sink the batch
+            valid = []
+            for i, data in enumerate(batch):
+                try:
+                    valid.append(row_adapter.validate_python(data))
+                except ValidationError as e:
+                    if errors is not None:
+                        errors.append((offset + i, e))
+            _append(columns, valid)
+        offset += len(batch)
+    return columns
+
+
+def validate_json_columns(
+    model: type[BaseModel],
+    source: "JsonLines",
+    errors: Optional[list[tuple[int, ValidationError]]] = None,
+    batch_size: int = 1024,
+) -> dict[str, Column]:
+    """See `TemplateModel.to_columns_from_jsonl`."""
+    from .template_model import _iter_json_lines
+
+    row_adapter, _ = get_row_adapters(model)
+    validate_json = row_adapter.validate_json
+    columns = new_columns(model)
+    batch = []
+    for i, line in enumerate(_iter_json_lines(source)):
+        try:
+            batch.append(validate_json(line))
+        except ValidationError as e:
+            if errors is not None:
+                errors.append((i, e))
+        if len(batch) >= batch_size:
+            _append(columns, batch)
+            batch = []
+    _append(columns, batch)
+    return columns
+
+
+def render_columns(
+    template: "TemplateModel",
+    columns: Mapping[str, Column],
+    substitutions: Optional[Mapping[str, Any]] = None,
+) -> list[str]:
+    """See `TemplateModel.render_columns`."""
+    if substitutions is None:
+        substitutions = template.substitutions
+    compiled = template.compiled
+    allow_unknown = bool(template.delayed_substitution)
+    n_rows = len(next(iter(columns.values()))) if columns else 0
+
+    ## One iterable of strings per segment; literal and substituted segments are constant
+    parts: list[Iterable[str]] = []
+    text_columns: dict[str, list[str]] = {}
+    for seg in compiled.select_segments(substitutions, columns):
+        kind = type(seg)
+        if kind is str:
+            parts.append(repeat(seg, n_rows))  # type: ignore
+        elif kind is FieldSlot:
+            name = seg.name  # type: ignore
+            if name not in text_columns:
+                text_columns[name] = list(map(str, columns[name]))
+            parts.append(text_columns[name])
+        elif substitutions and seg.key in substitutions:  # type: ignore
+            parts.append(repeat(seg.render(substitutions), n_rows))  # type: ignore
+        elif seg.key in columns:  # type: ignore
+            ## `{key}` slots naming a field are filled per row, like `data` in `render`
+            key = seg.key  # type: ignore
+            parts.append([seg.render({key: value}) for value in columns[key]])  # type: ignore
+        elif allow_unknown:
+            parts.append(repeat(seg.raw, n_rows))  # type: ignore
+        else:
+            raise KeyError(seg.key)  # type: ignore
+    if not parts:
+        return [""] * n_rows
+    return ["".join(row) for row in zip(*parts)]
+
+
+def iter_rows(columns: Mapping[str, Column]) -> Iterator[dict[str, Any]]:
+    """The rows of `columns` as dicts, one at a time."""
+    names = list(columns)
+    for values in zip(*(columns[name] for name in names)):
+        yield dict(zip(names, values))
+
+
+def to_arrow(columns: Mapping[str, Column]) -> "pyarrow.Table":
+    """Convert columns to a `pyarrow.Table`. Requires pyarrow (the optional `arrow` group)."""
+    try:
+        import pyarrow as pa
+    except ImportError as e:
+        raise ImportError("to_arrow requires pyarrow: pip install pyarrow") from e
+
+    arrow_types = {"q": pa.int64(), "d": pa.float64()}
+    arrays = {}
+    for name, column in columns.items():
+        if isinstance(column, array):
+            ## Wrap the buffer without copying it
+            arrays[name] = pa.Array.from_buffers(
+                arrow_types[column.typecode], len(column), [None, pa.py_buffer(column)]
+            )
+        else:
+            arrays[name] = pa.array(column)
+    return pa.table(arrays)
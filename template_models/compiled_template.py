@@ -0,0 +1,302 @@
+import re
+from functools import lru_cache
+from string import Formatter
+from typing import Any, Iterator, Mapping, NamedTuple, Optional, Union
+
+_formatter = Formatter()
+
+
+class FieldSpec(NamedTuple):
+    """A parsed `<#name|type|description#>` field specification."""
+
+    name: str
+    type_str: Optional[str] = None
+    description: Optional[str] = None
+    ## False for two part specs, where `type_str` may just be a description
+    typed: bool = True
+
+    @classmethod
+    def parse(cls, spec: str) -> "FieldSpec":
+        parts = spec.split("|")
+        if len(parts) >= 3:
+            ## Extra separators belong to a union type, e.g. name|int | None|description
+            return cls(parts[0], "|".join(parts[1:-1]), parts[-1])
+        if len(parts) == 2:
+            ## A two part spec is either name|type or name|description
+            return cls(parts[0], parts[1], parts[1], typed=False)
+        return cls(parts[0])
+
+
+class FieldSlot(NamedTuple):
+    """A template position filled from a model instance attribute."""
+
+    name: str
+
+
+class SubSlot(NamedTuple):
+    """A `{key}` template position filled from substitutions or data."""
+
+    key: str
+    raw: str
+    conversion: Optional[str]
+    format_spec: str
+    simple: bool
+
+    @classmethod
+    def from_parse(cls, field_name: str, format_spec: str, conversion: Optional[str]) -> "SubSlot":
+        raw = "{" + field_name
+        if conversion:
+            raw += "!" + conversion
+        if format_spec:
+            raw += ":" + format_spec
+        raw += "}"
+        key = re.split(r"[.\[]", field_name, maxsplit=1)[0]
+        simple = key == field_name and key.isidentifier() and "{" not in format_spec
+        return cls(key, raw, conversion, format_spec, simple)
+
+    def render(self, mapping: Mapping[str, Any]) -> str:
+        if not self.simple:
+            return self.raw.format_map(mapping)
+        value = mapping[self.key]
+        if self.conversion:
+            value = _formatter.convert_field(value, self.conversion)
+        return format(value, self.format_spec)
+
+
+Segment = Union[str, FieldSlot, SubSlot]
+
+
+class CompiledTemplate:
+    """A template string parsed once into literal, field and substitution segments.
+
+    `segments` is used when substitutions or data are available; `raw_segments`
+    keeps the literal text verbatim (including `{key}` and `{{`) for renders
+    that have nothing to substitute.
+    """
+
+    __slots__ = ("template", "field_regex", "fields", "segments", "raw_segments", "sub_keys")
+
+    def __init__(self, template: str, field_regex: str):
+        self.template = template
+        self.field_regex = field_regex
+        pattern = re.compile(field_regex)
+        group = 1 if pattern.groups else 0
+
+        fields: list[FieldSpec] = []
+        segments: list[Segment] = []
+        raw_segments: list[Segment] = []
+        pos = 0
+        for match in pattern.finditer(template):
+            literal = template[pos : match.start()]
+            self._add_literal(segments, literal)
+            _append_literal(raw_segments, literal)
+            spec = FieldSpec.parse(match.group(group))
+            fields.append(spec)
+            segments.append(FieldSlot(spec.name))
+            raw_segments.append(FieldSlot(spec.name))
+            pos = match.end()
+        literal = template[pos:]
+        self._add_literal(segments, literal)
+        _append_literal(raw_segments, literal)
+
+        self.fields = tuple(fields)
+        self.segments = tuple(segments)
+        self.raw_segments = tuple(raw_segments)
+        self.sub_keys = frozenset(s.key for s in segments if type(s) is SubSlot)
+
+    @staticmethod
+    def _add_literal(segments: list[Segment], literal: str) -> None:
+        if not literal:
+            return
+        try:
+            parsed = list(_formatter.parse(literal))
+        except ValueError:
+            ## Unbalanced braces, leave the text as is
+            _append_literal(segments, literal)
+            return
+        for text, field_name, format_spec, conversion in parsed:
+            _append_literal(segments, text)
+            if field_name is not None:
+                segments.append(SubSlot.from_parse(field_name, format_spec or "", conversion))
+
+    def render(
+        self,
+        model_instance: Any,
+        substitutions: Optional[Mapping[str, Any]] = None,
+        data: Optional[Mapping[str, Any]] = None,
+        allow_unknown: bool = False,
+    ) -> str:
+        """Render the template in a single pass.
+        Args:
+            model_instance: Object whose attributes fill the field slots.
+            substitutions: Values for `{key}` slots, looked up before `data`.
+            data: Fallback values for `{key}` slots.
+            allow_unknown: Leave unknown `{key}` slots as they are instead of raising KeyError.
+        Returns:
+            The rendered text.
+        """
+        if not substitutions and not data:
+            return "".join(
+                seg if type(seg) is str else str(getattr(model_instance, seg.name))
+                for seg in self.raw_segments
+            )
+        substitutions = substitutions or {}
+        data = data or {}
+        parts = []
+        append = parts.append
+        for seg in self.segments:
+            kind = type(seg)
+            if kind is str:
+                append(seg)
+            elif kind is FieldSlot:
+                append(str(getattr(model_instance, seg.name)))
+            elif seg.key in substitutions:
+                append(seg.render(substitutions))
+            elif seg.key in data:
+                append(seg.render(data))
+            elif allow_unknown:
+                append(seg.raw)
+            else:
+                raise KeyError(seg.key)
+        return "".join(parts)
+
+    def render_dict(
+        self,
+        values: Mapping[str, Any],
+        substitutions: Optional[Mapping[str, Any]] = None,
+        data: Optional[Mapping[str, Any]] = None,
+        allow_unknown: bool = False,
+    ) -> str:
+        """Like `render`, but field slots are filled from `values[name]` instead of
+        instance attributes, so no model instance is needed. Values are rendered as given.
+        """
+        if not substitutions and not data:
+            return "".join(
+                seg if type(seg) is str else str(values[seg.name]) for seg in self.raw_segments
+            )
+        substitutions = substitutions or {}
+        data = data or {}
+        parts = []
+        append = parts.append
+        for seg in self.segments:
+            kind = type(seg)
+            if kind is str:
+                append(seg)
+            elif kind is FieldSlot:
+                append(str(values[seg.name]))
+            elif seg.key in substitutions:
+                append(seg.render(substitutions))
+            elif seg.key in data:
+                append(seg.render(data))
+            elif allow_unknown:
+                append(seg.raw)
+            else:
+                raise KeyError(seg.key)
+        return "".join(parts)
+
+    def iter_render(
+        self,
+        model_instance: Any,
+        substitutions: Optional[Mapping[str, Any]] = None,
+        data: Optional[Mapping[str, Any]] = None,
+        allow_unknown: bool = False,
+    ) -> Iterator[str]:
+        """Yield the rendered text segment by segment; joined, it equals `render`."""
+        render_segment = self.render_segment
+        for seg in self.select_segments(substitutions, data):
+            yield render_segment(seg, model_instance, substitutions, data, allow_unknown)
+
+    def select_segments(
+        self, substitutions: Optional[Mapping[str, Any]], data: Optional[Mapping[str, Any]]
+    ) -> tuple[Segment, ...]:
+        """The segments `render` walks for the given substitutions and data."""
+        return self.segments if substitutions or data else self.raw_segments
+
+    def pattern(
+        self, substitutions: Optional[Mapping[str, Any]] = None, prefix: str = "f"
+    ) -> tuple[str, tuple[tuple[str, str], ...]]:
+        """Regex source matching the text `render` produces, the inverse of rendering.
+        Field slots become capture groups named `{prefix}{n}` and a field used more
+        than once must repeat the same text. `{key}` slots in `substitutions` must
+        match their rendered value; other `{key}` slots match anything.
+        A slot followed by literal text captures up to the first occurrence of that
+        text, in an atomic group, so a non-matching input fails in linear time instead
+        of backtracking through every way of splitting it between the slots.
+        Returns:
+            The regex source (to be used with `fullmatch` and `re.DOTALL`) and the
+            `(group_name, field_name)` pairs in the order of the groups.
+        """
+        ## `get_text` passes the field values as `data`, so templates with fields are
+        ## rendered from `segments` (with `{{` unescaped) even without substitutions
+        segments = self.segments if substitutions or self.fields else self.raw_segments
+        ## Literal text (substituted `{key}` slots included) merged between the slots
+        items: list[Union[str, Segment]] = []
+        for seg in segments:
+            if type(seg) is SubSlot and substitutions and seg.key in substitutions:  # type: ignore
+                seg = seg.render(substitutions)  # type: ignore
+            if type(seg) is str and items and type(items[-1]) is str:
+                items[-1] += seg  # type: ignore
+            elif seg != "":
+                items.append(seg)
+
+        parts = []
+        groups: dict[str, str] = {}
+        for i, item in enumerate(items):
+            if type(item) is str:
+                parts.append(re.escape(item))  # type: ignore
+                continue
+            if type(item) is FieldSlot:
+                group = groups.get(item.name)  # type: ignore
+                if group is not None:
+                    parts.append(f"(?P={group})")
+                    continue
+                group = groups[item.name] = f"{prefix}{len(groups)}"  # type: ignore
+            else:
+                group = None
+            following = items[i + 1] if i + 1 < len(items) else None
+            if following is None:
+                body = ".*"
+            elif type(following) is str:
+                body = f"(?>(?:(?!{re.escape(following)}).)*)"  # type: ignore
+            else:
+                ## Adjacent slots have no delimiter between them; the first one stays lazy
+                body = ".*?"
+            parts.append(f"(?P<{group}>{body})" if group else body)
+        return "".join(parts), tuple((group, name) for name, group in groups.items())
+
+    @staticmethod
+    def render_segment(
+        seg: Segment,
+        model_instance: Any,
+        substitutions: Optional[Mapping[str, Any]] = None,
+        data: Optional[Mapping[str, Any]] = None,
+        allow_unknown: bool = False,
+    ) -> str:
+        """Render a single segment, with the same rules as `render`."""
+        kind = type(seg)
+        if kind is str:
+            return seg  # type: ignore
+        if kind is FieldSlot:
+            return str(getattr(model_instance, seg.name))
+        if substitutions and seg.key in substitutions:  # type: ignore
+            return seg.render(substitutions)  # type: ignore
+        if data and seg.key in data:  # type: ignore
+            return seg.render(data)  # type: ignore
+        if allow_unknown:
+            return seg.raw  # type: ignore
+        raise KeyError(seg.key)  # type: ignore
+
+
+def _append_literal(segments: list[Segment], literal: str) -> None:
+    if not literal:
+        return
+    if segments and type(segments[-1]) is str:
+        segments[-1] += literal
+    else:
+        segments.append(literal)
+
+
+@lru_cache(maxsize=1024)
+def compile_template(template: str, field_regex: str) -> CompiledTemplate:
+    """Return the (cached) compiled form of `template`."""
+    return CompiledTemplate(template, field_regex)
@@ -0,0 +1,175 @@
+"""Opt-in per-stage timing for template models.
+
+Nothing is measured until a hook is registered with `add_hook`; until then every
+`span` is a shared no-op object. Hooks receive one `StageEvent` per stage:
+
+- format: applying substitutions to the template, descriptions and class doc
+- parse: extracting field definitions from the template
+- create_model: resolving the model class (`cache_hit` tells whether it was cached)
+- validate: building model instances from data
+- render: turning instances into text (`size` is the number of characters)
+- llm: a completion request (`prompt_tokens`/`completion_tokens` when reported)
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from random import Random
+from threading import Lock
+from time import perf_counter
+from typing import Any, Callable, Optional
+
+
+@dataclass(frozen=True)
+class StageEvent:
+    stage: str
+    class_name: Optional[str]
+    duration: float
+    size: Optional[int] = None
+    cache_hit: Optional[bool] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+Hook = Callable[[StageEvent], None]
+
+_hooks: list[Hook] = []
+
+
+def add_hook(hook: Hook) -> None:
+    """Register `hook` to receive every StageEvent."""
+    _hooks.append(hook)
+
+
+def remove_hook(hook: Hook) -> None:
+    _hooks.remove(hook)
+
+
+def enabled() -> bool:
+    return bool(_hooks)
+
+
+class Span:
+    """Times a stage and emits a StageEvent to every hook on exit."""
+
+    __slots__ = ("stage", "class_name", "attrs", "start")
+
+    def __init__(self, stage: str, class_name: Optional[str]):
+        self.stage = stage
+        self.class_name = class_name
+        self.attrs: dict[str, Any] = {}
+        self.start = 0.0
+
+    def set(self, **attrs: Any) -> None:
+        """Attach size, cache_hit or token counts to the event."""
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> "Span":
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        event = StageEvent(
+            self.stage, self.class_name, perf_counter() - self.start, **self.attrs
+        )
+        for hook in _hooks:
+            hook(event)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set(self, **attrs: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(stage: str, class_name: Optional[str] = None) -> Any:
+    """Return a context manager timing `stage`, or a shared no-op when no hooks are registered."""
+    if not _hooks:
+        return NULL_SPAN
+    return Span(stage, class_name)
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class StatsAggregator:
+    """In-process hook that aggregates StageEvents per class name and stage.
+
+    Counts and counters are exact. Percentiles come from a uniform reservoir sample of
+    at most `max_samples` durations per class name and stage, so memory stays bounded
+    in long-running processes.
+
+    Usage:
+        stats = StatsAggregator()
+        add_hook(stats)
+        ...
+        stats.report()  # {class_name: {stage: {"count": ..., "p50": ..., ...}}}
+    """
+
+    def __init__(self, max_samples: int = 4096):
+        if max_samples < 1:
+            raise ValueError(f"max_samples must be >= 1, got {max_samples}")
+        self.max_samples = max_samples
+        self._lock = Lock()
+        self._random = Random()
+        self._durations: dict[tuple[Optional[str], str], list[float]] = defaultdict(list)
+        self._counts: dict[tuple[Optional[str], str], int] = defaultdict(int)
+        self._counters: dict[tuple[Optional[str], str], dict[str, int]] = defaultdict(
+            lambda: defaultdict(int)
+        )
+
+    def __call__(self, event: StageEvent) -> None:
+        key = (event.class_name, event.stage)
+        with self._lock:
+            self._counts[key] += 1
+            durations = self._durations[key]
+            if len(durations) < self.max_samples:
+                durations.append(event.duration)
+            else:
+                ## Reservoir sampling: keep each of the n events seen so far with equal chance
+                i = self._random.randrange(self._counts[key])
+                if i < self.max_samples:
+                    durations[i] = event.duration
+            counters = self._counters[key]
+            if event.cache_hit is not None:
+                counters["cache_hits" if event.cache_hit else "cache_misses"] += 1
+            if event.size is not None:
+                counters["size"] += event.size
+            if event.prompt_tokens is not None:
+                counters["prompt_tokens"] += event.prompt_tokens
+            if event.completion_tokens is not None:
+                counters["completion_tokens"] += event.completion_tokens
+
+    def report(self) -> dict[Optional[str], dict[str, dict[str, float]]]:
+        """Count, p50/p95/p99 duration (seconds) and counters per class name and stage."""
+        report: dict[Optional[str], dict[str, dict[str, float]]] = defaultdict(dict)
+        with self._lock:
+            for (class_name, stage), durations in self._durations.items():
+                values = sorted(durations)
+                report[class_name][stage] = {
+                    "count": self._counts[(class_name, stage)],
+                    "p50": _percentile(values, 50),
+                    "p95": _percentile(values, 95),
+                    "p99": _percentile(values, 99),
+                    **self._counters[(class_name, stage)],
+                }
+        return dict(report)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._durations.clear()
+            self._counts.clear()
+            self._counters.clear()
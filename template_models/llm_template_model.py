@@ -1,24 +1,34 @@
-from dataclasses import dataclass
-from typing import Any, Optional
+from __future__ import annotations
 
-from openai import OpenAI
-from pydantic import BaseModel
-from qrev_instructor import get_api_service, get_client, instructor
+import asyncio
+import copy
+import json
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Iterable, Iterator, NamedTuple, Optional, Union
 
-from .template_model import TemplateModel
+from pydantic import BaseModel, Field, ValidationError, create_model
 
+from .client_pool import ClientPool, default_client_pool, wrap_client
+from .compiled_template import FieldSlot
+from .instrumentation import span
+from .response_cache import ResponseCache
+from .scheduler import Priority, Scheduler
+from .template_model import TemplateModel
+from .type_parser import type_mapping
 
-def generate_tool_schema(pydantic_model):
-    schema = pydantic_model.schema()
+## openai/anthropic/instructor are only imported when a client is first needed
+if TYPE_CHECKING:
+    from qrev_instructor import instructor
 
-    # Find non-optional fields
-    required_fields = [
-        field for field, field_info in pydantic_model.__fields__.items() if field_info.required
-    ]
+logger = logging.getLogger(__name__)
 
-    # Add required fields to the schema
-    schema["required"] = required_fields
 
+def generate_tool_schema(pydantic_model):
+    """Tool definition for `pydantic_model`, with the compact schema sent to the LLM."""
+    schema = get_prompt_model(pydantic_model).model_json_schema()
     tool_definition = {
         "name": pydantic_model.__name__,
         "description": pydantic_model.__doc__ or "",
@@ -27,10 +37,236 @@ def generate_tool_schema(pydantic_model):
     return tool_definition
 
 
+BATCH_INSTRUCTIONS = (
+    "Extract one record for each input below. "
+    "Set each record's index to the index of the input it was extracted from."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)."""
+    return len(text) // 4 + 1
+
+
+def get_usage(response: Any) -> dict[str, int]:
+    """Token usage of the completion behind an instructor response, if reported."""
+    usage = getattr(getattr(response, "_raw_response", None), "usage", None)
+    if usage is None:
+        return {}
+    ## OpenAI reports prompt/completion tokens, Anthropic input/output tokens
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or getattr(usage, "input_tokens", None)
+    completion_tokens = getattr(usage, "completion_tokens", None) or getattr(
+        usage, "output_tokens", None
+    )
+    tokens = {}
+    if isinstance(prompt_tokens, int):
+        tokens["prompt_tokens"] = prompt_tokens
+    if isinstance(completion_tokens, int):
+        tokens["completion_tokens"] = completion_tokens
+    return tokens
+
+
+def compact_schema(schema: Any, name: Optional[str] = None) -> Any:
+    """Return a copy of a JSON schema without the parts that cost tokens but tell the LLM nothing.
+    - `title` is dropped everywhere except the top level (instructor names the tool after it)
+    - descriptions that just repeat the field name or its type are dropped, and so are
+      descriptions repeating the description of the model they reference
+    - `anyOf` of a simple type and null becomes a type list, enums drop their redundant `type`
+    """
+    if isinstance(schema, list):
+        return [compact_schema(item) for item in schema]
+    if not isinstance(schema, dict):
+        return schema
+    compact = {}
+    for key, value in schema.items():
+        if key == "properties":
+            compact[key] = {prop: compact_schema(sub, prop) for prop, sub in value.items()}
+        elif key == "$defs":
+            compact[key] = {def_name: compact_schema(sub) for def_name, sub in value.items()}
+        elif key == "title":
+            continue
+        else:
+            compact[key] = compact_schema(value)
+    description = compact.get("description")
+    if isinstance(description, str) and name is not None:
+        normalized = description.strip().lower()
+        if normalized in (name.lower(), name.replace("_", " ").lower()) or description in type_mapping:
+            del compact["description"]
+    any_of = compact.get("anyOf")
+    if isinstance(any_of, list) and len(any_of) == 2 and {"type": "null"} in any_of:
+        other = any_of[0] if any_of[1] == {"type": "null"} else any_of[1]
+        if set(other) == {"type"} and isinstance(other["type"], str):
+            del compact["anyOf"]
+            compact["type"] = [other["type"], "null"]
+    if "enum" in compact and compact.get("type") == "string":
+        del compact["type"]
+    return compact
+
+
+def _drop_ref_descriptions(schema: dict[str, Any]) -> None:
+    defs = schema.get("$defs", {})
+
+    def visit(node: Any) -> None:
+        if isinstance(node, list):
+            for item in node:
+                visit(item)
+        elif isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and "description" in node:
+                target = defs.get(ref.rsplit("/", 1)[-1], {})
+                if target.get("description") == node["description"]:
+                    del node["description"]
+            for value in node.values():
+                visit(value)
+
+    visit(schema)
+
+
+class _CompactSchema:
+    """Mixin for the models sent to the LLM: `model_json_schema` returns the compact schema."""
+
+    @classmethod
+    def model_json_schema(cls, *args: Any, **kwargs: Any) -> dict[str, Any]:
+        if args or kwargs:
+            return cls._compact_schema(super().model_json_schema(*args, **kwargs))  # type: ignore
+        ## Instructor asks for the schema on every request and may modify it
+        cached = cls.__dict__.get("_schema_cache")
+        if cached is None:
+            cached = cls._compact_schema(super().model_json_schema())  # type: ignore
+            setattr(cls, "_schema_cache", cached)
+        return copy.deepcopy(cached)
+
+    @staticmethod
+    def _compact_schema(schema: dict[str, Any]) -> dict[str, Any]:
+        title = schema.get("title")
+        compact = compact_schema(schema)
+        _drop_ref_descriptions(compact)
+        if title is not None:
+            compact["title"] = title
+        return compact
+
+
+@lru_cache(maxsize=256)
+def get_prompt_model(pymodel: type[BaseModel]) -> type[BaseModel]:
+    """Subclass of `pymodel` used as instructor's response model, with a compact JSON schema.
+    Instances are converted back to `pymodel` with `to_response_model`.
+    """
+    return type(
+        pymodel.__name__,
+        (_CompactSchema, pymodel),
+        {"__doc__": pymodel.__doc__, "__module__": pymodel.__module__},
+    )
+
+
+def to_response_model(pymodel: type[BaseModel], instance: BaseModel) -> BaseModel:
+    """Rebuild an (already validated) prompt model instance as a `pymodel` instance."""
+    if type(instance) is pymodel:
+        return instance
+    result = pymodel.model_construct(_fields_set=instance.model_fields_set, **instance.__dict__)
+    raw_response = getattr(instance, "_raw_response", None)
+    if raw_response is not None:
+        ## Keep the completion (and its usage) attached, the way instructor does
+        object.__setattr__(result, "_raw_response", raw_response)
+    return result
+
+
+@lru_cache(maxsize=256)
+def schema_tokens(pymodel: type[BaseModel]) -> int:
+    """Estimated tokens of the compact tool schema sent for `pymodel`."""
+    return estimate_tokens(json.dumps(get_prompt_model(pymodel).model_json_schema()))
+
+
+@lru_cache(maxsize=256)
+def get_reduced_model(pymodel: type[BaseModel], field_names: tuple[str, ...]) -> type[BaseModel]:
+    """Model with only `field_names` of `pymodel`, with the same types and descriptions."""
+    fields = pymodel.model_fields
+    return create_model(  # type: ignore
+        pymodel.__name__,
+        __doc__=pymodel.__doc__,
+        **{name: (fields[name].annotation, fields[name]) for name in field_names},
+    )
+
+
+def split_known(
+    pymodel: type[BaseModel], known: Optional[dict[str, Any]]
+) -> tuple[dict[str, Any], Optional[type[BaseModel]]]:
+    """Split `known` field values into the valid ones and a model for the rest.
+    Returns:
+        The known values that validate, and the model to ask the LLM for: `pymodel`
+        when nothing is known, a reduced model with only the missing or invalid
+        fields, or None when every field is known.
+    """
+    if known is None:
+        return {}, pymodel
+    try:
+        pymodel.model_validate(known)
+        return dict(known), None
+    except ValidationError as e:
+        invalid = {
+            error["loc"][0] for error in e.errors() if error["loc"] and error["type"] != "missing"
+        }
+    valid = {k: v for k, v in known.items() if k in pymodel.model_fields and k not in invalid}
+    missing = tuple(name for name in pymodel.model_fields if name not in valid)
+    return valid, get_reduced_model(pymodel, missing)
+
+
+def merge_known(pymodel: type[BaseModel], known: dict[str, Any], result: BaseModel) -> BaseModel:
+    """Combine known values with an LLM result for the remaining fields into a `pymodel` instance."""
+    if not known and type(result) is pymodel:
+        return result
+    values = dict(known)
+    values.update((name, getattr(result, name)) for name in type(result).model_fields)
+    return pymodel.model_validate(values)
+
+
+class _InstanceRequest(NamedTuple):
+    """A single-instance request, resolved before it is sent."""
+
+    pymodel: type[BaseModel]
+    model_name: str
+    system_prompt: Optional[str]
+    known_values: dict[str, Any]
+    ## None when every field is known and nothing has to be requested
+    request_model: Optional[type[BaseModel]]
+    cache_key: Optional[str]
+
+
+def build_messages(query: str, system_prompt: Optional[str] = None) -> list[dict[str, str]]:
+    """Chat messages for a request, the stable system prompt first so provider prompt caching can hit."""
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": query})
+    return messages
+
+
+def _total_tokens(response: Any) -> Optional[int]:
+    return sum(get_usage(response).values()) or None
+
+
+@lru_cache(maxsize=256)
+def get_batch_model(pymodel: type[BaseModel]) -> type[BaseModel]:
+    """Wrap `pymodel` in a container model holding one indexed record per input."""
+    item_model = create_model(
+        f"{pymodel.__name__}Item",
+        index=(int, Field(..., description="Index of the input the record was extracted from")),
+        record=(pymodel, ...),
+    )
+    return create_model(
+        f"{pymodel.__name__}Batch",
+        __base__=(_CompactSchema, BaseModel),
+        records=(list[item_model], Field(..., description="One record per input")),  # type: ignore
+    )
+
+
 @dataclass
 class LLMTemplateModel(TemplateModel):
     system_prompt: Optional[str] = None
     model_name: str = "gpt-4o-mini"
+    response_cache: Optional[ResponseCache] = field(default=None, repr=False, compare=False)
+    client_pool: Optional[ClientPool] = field(default=None, repr=False, compare=False)
+    ## Rate limits, retries and fallbacks for requests; None sends them directly
+    scheduler: Optional[Scheduler] = field(default=None, repr=False, compare=False)
 
     def generate_instance(
         self,
@@ -43,30 +279,284 @@ class LLMTemplateModel(TemplateModel):
         llm: Optional[instructor.Instructor] = None,
         model_name: Optional[str] = None,
         temperature: float = 0.0,
+        use_cache: bool = True,
+        priority: int = Priority.INTERACTIVE,
+        known: Optional[dict[str, Any]] = None,
+    ) -> BaseModel:
+        """Extract an instance of the template's model from `query`.
+        Args:
+            query: The text to extract from.
+            known: Field values that are already known, e.g. from a human correction or
+                an earlier result that failed validation. Only the fields that are missing
+                or fail validation are requested from the LLM, with a reduced model, and
+                the result is merged with the valid known values.
+            priority: Scheduler priority of the request.
+        Returns:
+            An instance of the template's model.
+        """
+        request = self._instance_request(
+            query,
+            class_name=class_name,
+            class_doc=class_doc,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            model_name=model_name,
+            temperature=temperature,
+            use_cache=use_cache,
+            known=known,
+        )
+        if request.request_model is None:
+            return self._finish_instance(request, None)
+        with self._request_span(request) as s:
+            cached = self._cached_instance(request, s)
+            if cached is not None:
+                return cached
+            # Extract structured data from natural language
+            model_instance = self._create(
+                query,
+                request.model_name,
+                request.request_model,
+                llm,
+                priority,
+                request.system_prompt,
+                temperature,
+            )
+            s.set(**get_usage(model_instance))
+        return self._finish_instance(request, model_instance)
+
+    def _instance_request(
+        self,
+        query: str,
+        class_name: Optional[str],
+        class_doc: Optional[str],
+        system_prompt: Optional[str],
+        substitutions: Optional[dict[str, Any]],
+        model_name: Optional[str],
+        temperature: float,
+        use_cache: bool,
+        known: Optional[dict[str, Any]],
+    ) -> _InstanceRequest:
+        """Everything `generate_instance` and `agenerate_instance` decide before the request."""
+        model_name, system_prompt, pymodel = self._prepare(
+            class_name=class_name,
+            class_doc=class_doc,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            model_name=model_name,
+        )
+        known_values, request_model = split_known(pymodel, known)
+        cache_key = None
+        if request_model is not None and use_cache and self.response_cache is not None:
+            cache_key = self._cache_key(query, model_name, system_prompt, temperature, request_model)
+        return _InstanceRequest(
+            pymodel, model_name, system_prompt, known_values, request_model, cache_key
+        )
+
+    @contextmanager
+    def _request_span(self, request: _InstanceRequest) -> Iterator[Any]:
+        """The `llm` instrumentation span of a request, logging failures."""
+        with span("llm", request.pymodel.__name__) as s:
+            try:
+                yield s
+            except Exception as e:
+                logger.error("Request for %s failed: %s", request.pymodel.__name__, e)
+                raise
+
+    def _cached_instance(self, request: _InstanceRequest, s: Any) -> Optional[BaseModel]:
+        """The cached response for `request` merged with the known values, if any."""
+        if request.cache_key is None:
+            return None
+        cached = self.response_cache.get(request.cache_key)  # type: ignore
+        s.set(cache_hit=cached is not None)
+        if cached is None:
+            return None
+        return merge_known(
+            request.pymodel,
+            request.known_values,
+            request.request_model.model_validate_json(cached),  # type: ignore
+        )
+
+    def _finish_instance(
+        self, request: _InstanceRequest, model_instance: Optional[BaseModel]
     ) -> BaseModel:
+        """Cache a response and merge it with the known values into a full instance."""
+        if model_instance is None:
+            return request.pymodel.model_validate(request.known_values)
+        if request.cache_key is not None:
+            self.response_cache.set(request.cache_key, model_instance.model_dump_json())  # type: ignore
+        return merge_known(request.pymodel, request.known_values, model_instance)
+
+    def _prepare(
+        self,
+        class_name: Optional[str],
+        class_doc: Optional[str],
+        system_prompt: Optional[str],
+        substitutions: Optional[dict[str, Any]],
+        model_name: Optional[str],
+    ) -> tuple[str, Optional[str], type[BaseModel]]:
+        """Resolve the model name, system prompt and response model for a request."""
         model_name = model_name or self.model_name
         system_prompt = system_prompt or self.system_prompt
 
         if system_prompt and substitutions:
             ## Has to be allow_unknown because llama_index also can have substitutions
             system_prompt = self._format(system_prompt, substitutions, allow_unknown=True)
-        client = get_client(model=model_name, client=llm)
 
         pymodel = self.get_model(
             substitutions=substitutions, class_name=class_name, class_doc=class_doc
         )
+        return model_name, system_prompt, pymodel
 
-        try:
-            # Extract structured data from natural language
-            model_instance = client.chat.completions.create(
-                model=model_name,
-                messages=[{"role": "user", "content": query}],
-                response_model=pymodel,
+    def estimate_prompt_tokens(
+        self,
+        query: str,
+        class_name: str | None = None,
+        class_doc: str | None = None,
+        system_prompt: Optional[str] = None,
+        substitutions: Optional[dict[str, Any]] = None,
+    ) -> dict[str, int]:
+        """Estimated prompt tokens of a `generate_instance` request, per part.
+        `full_schema` is what the uncompacted pydantic schema would cost, for comparison.
+        Actual counts reported by the provider are in the `llm` instrumentation events.
+        """
+        _, system_prompt, pymodel = self._prepare(
+            class_name=class_name,
+            class_doc=class_doc,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            model_name=None,
+        )
+        return {
+            "system_prompt": estimate_tokens(system_prompt) if system_prompt else 0,
+            "schema": schema_tokens(pymodel),
+            "full_schema": estimate_tokens(json.dumps(pymodel.model_json_schema())),
+            "query": estimate_tokens(query),
+        }
+
+    def _create(
+        self,
+        query: str,
+        model_name: str,
+        response_model: type[BaseModel],
+        llm: Optional[Any],
+        priority: int,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.0,
+    ) -> Any:
+        """Send one completion request, through the scheduler if there is one.
+        The response model is sent with its compact schema; the result is a `response_model` instance.
+        """
+        prompt_model = (
+            response_model
+            if issubclass(response_model, _CompactSchema)
+            else get_prompt_model(response_model)
+        )
+        messages = build_messages(query, system_prompt)
+
+        def request(model: str) -> Any:
+            client = self._resolve_client(model, llm)
+            return client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_model=prompt_model,
+                temperature=temperature,
+            )
+
+        if self.scheduler is None:
+            result = request(model_name)
+        else:
+            tokens = estimate_tokens(system_prompt or "") + schema_tokens(response_model)
+            result = self.scheduler.call(
+                model_name,
+                request,
+                tokens=tokens + estimate_tokens(query),
+                priority=priority,
+                usage=_total_tokens,
+            )
+        return to_response_model(response_model, result)
+
+    async def _acreate(
+        self,
+        query: str,
+        model_name: str,
+        response_model: type[BaseModel],
+        llm: Optional[Any],
+        priority: int,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.0,
+    ) -> Any:
+        """Async version of `_create`."""
+        prompt_model = (
+            response_model
+            if issubclass(response_model, _CompactSchema)
+            else get_prompt_model(response_model)
+        )
+        messages = build_messages(query, system_prompt)
+
+        async def request(model: str) -> Any:
+            client = self._resolve_client(model, llm, asynchronous=True)
+            return await client.chat.completions.create(
+                model=model,
+                messages=messages,
+                response_model=prompt_model,
+                temperature=temperature,
             )
-            return model_instance
-        except Exception as e:
-            print(e)
-            raise
+
+        if self.scheduler is None:
+            result = await request(model_name)
+        else:
+            tokens = estimate_tokens(system_prompt or "") + schema_tokens(response_model)
+            result = await self.scheduler.acall(
+                model_name,
+                request,
+                tokens=tokens + estimate_tokens(query),
+                priority=priority,
+                usage=_total_tokens,
+            )
+        return to_response_model(response_model, result)
+
+    def _resolve_client(
+        self, model_name: str, llm: Optional[Any] = None, asynchronous: bool = False
+    ) -> Any:
+        """Return an instructor client for `model_name`.
+        `llm` may be a raw provider client (OpenAI, Anthropic), which gets wrapped,
+        or an already patched instructor client, which is used as is. Without `llm`
+        the client comes from the pool, so connections are reused across calls.
+        """
+        if llm is None:
+            return self._client_pool.get(model_name, asynchronous=asynchronous)
+        client_cls_name = llm.__class__.__name__.lower()
+        if "openai" in client_cls_name or "anthropic" in client_cls_name:
+            return wrap_client(llm)
+        return llm
+
+    def close(self) -> None:
+        """Close the `client_pool` given to this model.
+        Models using the process-wide `default_client_pool` leave it open, since other
+        models share it; close it with `default_client_pool.close()` at shutdown.
+        """
+        if self.client_pool is not None:
+            self.client_pool.close()
+
+    @property
+    def _client_pool(self) -> ClientPool:
+        return default_client_pool if self.client_pool is None else self.client_pool
+
+    @staticmethod
+    def _cache_key(
+        query: str,
+        model_name: str,
+        system_prompt: Optional[str],
+        temperature: float,
+        pymodel: type[BaseModel],
+    ) -> str:
+        return ResponseCache.make_key(
+            model_name=model_name,
+            system_prompt=system_prompt,
+            query=query,
+            temperature=temperature,
+            schema=pymodel.model_json_schema(),
+        )
 
     def generate_text(
         self,
@@ -77,6 +567,7 @@ class LLMTemplateModel(TemplateModel):
         llm: Optional[instructor.Instructor] = None,
         model_name: Optional[str] = None,
         temperature: float = 0.0,
+        known: Optional[dict[str, Any]] = None,
     ) -> str:
         """Generate text from the query using the llm model.
         """
@@ -90,5 +581,323 @@ class LLMTemplateModel(TemplateModel):
             llm=llm,
             model_name=model_name,
             temperature=temperature,
+            known=known,
         )
         return self.get_text_from_instance(instance)
+
+    def generate_instances(
+        self,
+        queries: Iterable[str],
+        batch_size: int = 10,
+        max_batch_tokens: int = 4000,
+        class_name: str | None = None,
+        class_doc: str | None = None,
+        system_prompt: Optional[str] = None,
+        substitutions: Optional[dict[str, Any]] = None,
+        llm: Optional[instructor.Instructor] = None,
+        model_name: Optional[str] = None,
+        temperature: float = 0.0,
+        use_cache: bool = True,
+        priority: int = Priority.BATCH,
+    ) -> list[BaseModel]:
+        """Generate one instance per query, packing several queries into each completion.
+        Args:
+            queries: The queries to extract from.
+            batch_size: Maximum number of queries per completion.
+            max_batch_tokens: Estimated token budget for the queries of one completion.
+            priority: Scheduler priority of the requests.
+        Returns:
+            One instance per query, in input order. Queries missing from a batched
+            response, or whose batch failed, are retried with `generate_instance`.
+        """
+        if batch_size < 1:
+            raise ValueError(f"batch_size must be >= 1, got {batch_size}")
+        queries = list(queries)
+        model_name, system_prompt, pymodel = self._prepare(
+            class_name=class_name,
+            class_doc=class_doc,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            model_name=model_name,
+        )
+        single_kwargs = dict(
+            class_name=class_name,
+            class_doc=class_doc,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            llm=llm,
+            model_name=model_name,
+            temperature=temperature,
+            use_cache=use_cache,
+            priority=priority,
+        )
+
+        results: list[Optional[BaseModel]] = [None] * len(queries)
+        pending = []
+        for i, query in enumerate(queries):
+            if use_cache and self.response_cache is not None:
+                key = self._cache_key(query, model_name, system_prompt, temperature, pymodel)
+                cached = self.response_cache.get(key)
+                if cached is not None:
+                    results[i] = pymodel.model_validate_json(cached)
+                    continue
+            pending.append(i)
+
+        batch_model = get_batch_model(pymodel)
+        ## The instructions are the same for every batch, so they go in the cacheable prefix
+        batch_system_prompt = "\n\n".join(filter(None, [system_prompt, BATCH_INSTRUCTIONS]))
+        for batch in self._pack(queries, pending, batch_size, max_batch_tokens):
+            if len(batch) == 1:
+                continue
+            prompt = "\n\n".join(
+                f'<input index="{n}">\n{queries[i]}\n</input>' for n, i in enumerate(batch)
+            )
+            with span("llm", batch_model.__name__) as s:
+                try:
+                    response = self._create(
+                        prompt,
+                        model_name,
+                        batch_model,
+                        llm,
+                        priority,
+                        batch_system_prompt,
+                        temperature,
+                    )
+                except Exception as e:
+                    logger.warning("Batched request failed, retrying its queries one by one: %s", e)
+                    continue
+                s.set(size=len(batch), **get_usage(response))
+            for item in response.records:  # type: ignore
+                if 0 <= item.index < len(batch) and results[batch[item.index]] is None:
+                    results[batch[item.index]] = item.record
+
+        for i in pending:
+            if results[i] is None:
+                results[i] = self.generate_instance(queries[i], **single_kwargs)  # type: ignore
+            elif use_cache and self.response_cache is not None:
+                key = self._cache_key(queries[i], model_name, system_prompt, temperature, pymodel)
+                self.response_cache.set(key, results[i].model_dump_json())  # type: ignore
+        return results  # type: ignore
+
+    @staticmethod
+    def _pack(
+        queries: list[str], indices: list[int], batch_size: int, max_batch_tokens: int
+    ) -> Iterable[list[int]]:
+        """Group query indices into batches bounded by count and estimated tokens."""
+        batch: list[int] = []
+        tokens = 0
+        for i in indices:
+            query_tokens = estimate_tokens(queries[i])
+            if batch and (len(batch) >= batch_size or tokens + query_tokens > max_batch_tokens):
+                yield batch
+                batch, tokens = [], 0
+            batch.append(i)
+            tokens += query_tokens
+        if batch:
+            yield batch
+
+    def stream_instance(
+        self,
+        query: str,
+        class_name: str | None = None,
+        class_doc: str | None = None,
+        system_prompt: Optional[str] = None,
+        substitutions: Optional[dict[str, Any]] = None,
+        llm: Optional[instructor.Instructor] = None,
+        model_name: Optional[str] = None,
+        temperature: float = 0.0,
+    ) -> Iterator[BaseModel]:
+        """Stream partially populated instances as the completion arrives.
+        Fields that have not arrived yet are None (or unset). The last instance
+        yielded is the fully validated model instance.
+        """
+        model_name, system_prompt, pymodel = self._prepare(
+            class_name=class_name,
+            class_doc=class_doc,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            model_name=model_name,
+        )
+        client = self._resolve_client(model_name, llm)
+
+        partial = None
+        try:
+            for partial in client.chat.completions.create_partial(
+                model=model_name,
+                messages=build_messages(query, system_prompt),
+                response_model=get_prompt_model(pymodel),
+                temperature=temperature,
+            ):
+                yield partial
+        except Exception as e:
+            logger.error("Streaming request for %s failed: %s", pymodel.__name__, e)
+            raise
+        values = {name: getattr(partial, name, None) for name in pymodel.model_fields}
+        yield pymodel.model_validate(values)
+
+    def stream_text(
+        self,
+        query: str,
+        system_prompt: Optional[str] = None,
+        substitutions: Optional[dict[str, Any]] = None,
+        llm: Optional[instructor.Instructor] = None,
+        model_name: Optional[str] = None,
+        temperature: float = 0.0,
+    ) -> Iterator[str]:
+        """Stream the rendered text in chunks as soon as the fields they depend on are complete.
+        A field counts as complete once a later field has started to arrive, or the
+        completion has finished. Joining the chunks gives the `generate_text` result.
+        """
+        if substitutions:
+            raise NotImplementedError("Substitutions are not supported for LLMTemplateModel yet")
+        compiled = self.compiled
+        template_subs = self.substitutions
+        allow_unknown = bool(self.delayed_substitution)
+        segments = compiled.select_segments(template_subs, None)
+        pos = 0
+        instance = None
+        for instance in self.stream_instance(
+            query,
+            system_prompt=system_prompt,
+            llm=llm,
+            model_name=model_name,
+            temperature=temperature,
+        ):
+            complete = self._complete_fields(instance)
+            chunk = []
+            while pos < len(segments):
+                seg = segments[pos]
+                if type(seg) is FieldSlot and seg.name not in complete:
+                    break
+                chunk.append(
+                    compiled.render_segment(seg, instance, template_subs, None, allow_unknown)
+                )
+                pos += 1
+            if chunk:
+                yield "".join(chunk)
+        ## The last instance is the validated one, so everything left can be rendered
+        if pos < len(segments):
+            yield "".join(
+                compiled.render_segment(seg, instance, template_subs, None, allow_unknown)
+                for seg in segments[pos:]
+            )
+
+    @staticmethod
+    def _complete_fields(partial: BaseModel) -> set[str]:
+        """Fields of a partial instance that are followed by a field that has started."""
+        names = list(type(partial).model_fields)
+        complete: set[str] = set()
+        for i in range(len(names) - 1, -1, -1):
+            if getattr(partial, names[i], None) is not None:
+                complete.update(names[:i])
+                break
+        return complete
+
+    async def agenerate_instance(
+        self,
+        query: str,
+        class_name: str | None = None,
+        class_doc: str | None = None,
+        system_prompt: Optional[str] = None,
+        substitutions: Optional[dict[str, Any]] = None,
+        verbose: bool = True,
+        llm: Optional[instructor.AsyncInstructor] = None,
+        model_name: Optional[str] = None,
+        temperature: float = 0.0,
+        use_cache: bool = True,
+        priority: int = Priority.INTERACTIVE,
+        known: Optional[dict[str, Any]] = None,
+    ) -> BaseModel:
+        """Async version of `generate_instance`, backed by an async instructor client."""
+        request = self._instance_request(
+            query,
+            class_name=class_name,
+            class_doc=class_doc,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            model_name=model_name,
+            temperature=temperature,
+            use_cache=use_cache,
+            known=known,
+        )
+        if request.request_model is None:
+            return self._finish_instance(request, None)
+        with self._request_span(request) as s:
+            cached = self._cached_instance(request, s)
+            if cached is not None:
+                return cached
+            # Extract structured data from natural language
+            model_instance = await self._acreate(
+                query,
+                request.model_name,
+                request.request_model,
+                llm,
+                priority,
+                request.system_prompt,
+                temperature,
+            )
+            s.set(**get_usage(model_instance))
+        return self._finish_instance(request, model_instance)
+
+    async def agenerate_text(
+        self,
+        query: str,
+        system_prompt: Optional[str] = None,
+        substitutions: Optional[dict[str, Any]] = None,
+        verbose: bool = True,
+        llm: Optional[instructor.AsyncInstructor] = None,
+        model_name: Optional[str] = None,
+        temperature: float = 0.0,
+        known: Optional[dict[str, Any]] = None,
+    ) -> str:
+        """Async version of `generate_text`."""
+        if substitutions:
+            raise NotImplementedError("Substitutions are not supported for LLMTemplateModel yet")
+        instance = await self.agenerate_instance(
+            query=query,
+            system_prompt=system_prompt,
+            substitutions=substitutions,
+            verbose=verbose,
+            llm=llm,
+            model_name=model_name,
+            temperature=temperature,
+            known=known,
+        )
+        return self.get_text_from_instance(instance)
+
+    async def agenerate_many(
+        self,
+        queries: Iterable[str],
+        max_concurrency: int = 8,
+        llm: Optional[instructor.AsyncInstructor] = None,
+        model_name: Optional[str] = None,
+        priority: int = Priority.BATCH,
+        **kwargs: Any,
+    ) -> list[Union[BaseModel, Exception]]:
+        """Generate instances for many queries concurrently.
+        Args:
+            queries: The queries to extract from.
+            max_concurrency: Maximum number of requests in flight at once.
+            llm: Async instructor client shared by every request.
+            priority: Scheduler priority of the requests.
+            kwargs: Extra arguments passed to `agenerate_instance`.
+        Returns:
+            One result per query, in input order. Failed queries hold the raised exception.
+        """
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be >= 1, got {max_concurrency}")
+        model_name = model_name or self.model_name
+        ## Without a scheduler, resolve the client once; with one, fallbacks may need others
+        client = llm if self.scheduler else self._resolve_client(model_name, llm, asynchronous=True)
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def run(query: str) -> Union[BaseModel, Exception]:
+            async with semaphore:
+                try:
+                    return await self.agenerate_instance(
+                        query, llm=client, model_name=model_name, priority=priority, **kwargs
+                    )
+                except Exception as e:
+                    return e
+
+        return await asyncio.gather(*(run(query) for query in queries))
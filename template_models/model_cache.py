@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Hashable, Optional
+
+from pydantic import BaseModel
+
+DEFAULT_MODEL_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True)
+class CacheInfo:
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class ModelCache:
+    """Bounded LRU cache of generated pydantic model classes.
+
+    Keys are built by `TemplateModel.get_model` from the effective template text,
+    the formatted descriptions, the class name and the class doc. Models added with
+    `pin` (e.g. the precompiled classes of `TemplateRegistry.from_module`) are kept
+    outside the LRU, so they are never evicted or cleared.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_MODEL_CACHE_SIZE):
+        if maxsize < 0:
+            raise ValueError(f"maxsize must be >= 0, got {maxsize}")
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, type[BaseModel]] = OrderedDict()
+        self._pinned: dict[Hashable, type[BaseModel]] = {}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._pinned or key in self._data
+
+    def get(self, key: Hashable) -> Optional[type[BaseModel]]:
+        with self._lock:
+            model = self._pinned.get(key)
+            if model is not None:
+                self.hits += 1
+                return model
+            model = self._data.get(key)
+            if model is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return model
+
+    def put(self, key: Hashable, model: type[BaseModel]) -> None:
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            self._data[key] = model
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pin(self, key: Hashable, model: type[BaseModel]) -> None:
+        """Store `model` for `key` permanently, regardless of `maxsize`."""
+        with self._lock:
+            self._pinned[key] = model
+            self._data.pop(key, None)
+
+    def get_or_create(
+        self, key: Hashable, factory: Callable[[], type[BaseModel]]
+    ) -> type[BaseModel]:
+        """Return the cached model for `key`, building it with `factory` on a miss."""
+        model = self.get(key)
+        if model is None:
+            model = factory()
+            self.put(key, model)
+        return model
+
+    def clear(self) -> None:
+        """Remove all cached (not pinned) models and reset the counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def info(self) -> CacheInfo:
+        return CacheInfo(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            maxsize=self.maxsize,
+            currsize=len(self._data),
+        )
@@ -0,0 +1,109 @@
+"""Process-pool rendering for CPU-bound bulk exports."""
+
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, Union
+
+from .template_model import TemplateModel
+
+## Set once per worker process by _init_worker
+_worker_template: Optional[TemplateModel] = None
+_worker_options: dict[str, Any] = {}
+
+
+def _init_worker(spec: dict[str, Any], options: dict[str, Any]) -> None:
+    global _worker_template, _worker_options
+    _worker_template = TemplateModel.from_spec(spec)
+    _worker_options = options
+    ## Build the dynamic model once per process
+    _worker_template.get_model(
+        substitutions=options["substitutions"],
+        class_name=options["class_name"],
+        class_doc=options["class_doc"],
+    )
+
+
+def _render_chunk(chunk: list[dict[str, Any]]) -> list[Optional[str]]:
+    assert _worker_template is not None
+    return _worker_template.get_texts(  # type: ignore
+        chunk,
+        substitutions=_worker_options["substitutions"],
+        class_name=_worker_options["class_name"],
+        class_doc=_worker_options["class_doc"],
+    )
+
+
+def _write_shard(index: int, chunk: list[dict[str, Any]]) -> Path:
+    output_dir = Path(_worker_options["output_dir"])
+    separator = _worker_options["separator"]
+    path = output_dir / f"part-{index:05d}.txt"
+    with open(path, "w", encoding="utf-8") as f:
+        for text in _render_chunk(chunk):
+            if text is not None:
+                f.write(text)
+                f.write(separator)
+    return path
+
+
+def render_parallel(
+    template: TemplateModel,
+    rows: Iterable[dict[str, Any]],
+    workers: Optional[int] = None,
+    chunksize: int = 1000,
+    substitutions: Optional[dict[str, Any]] = None,
+    class_name: Optional[str] = None,
+    class_doc: Optional[str] = None,
+    output_dir: Optional[Union[str, Path]] = None,
+    separator: str = "\n",
+) -> Union[Iterator[Optional[str]], list[Path]]:
+    """See `TemplateModel.render_parallel`."""
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be >= 1, got {chunksize}")
+    workers = workers or os.cpu_count() or 1
+    options = {
+        "substitutions": substitutions,
+        "class_name": class_name,
+        "class_doc": class_doc,
+        "output_dir": None if output_dir is None else str(output_dir),
+        "separator": separator,
+    }
+    if output_dir is not None:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+        return list(_run(template, rows, workers, chunksize, options, to_shards=True))
+    return _iter_texts(_run(template, rows, workers, chunksize, options, to_shards=False))
+
+
+def _iter_texts(chunks: Iterator[list[Optional[str]]]) -> Iterator[Optional[str]]:
+    for chunk in chunks:
+        yield from chunk
+
+
+def _run(
+    template: TemplateModel,
+    rows: Iterable[dict[str, Any]],
+    workers: int,
+    chunksize: int,
+    options: dict[str, Any],
+    to_shards: bool,
+) -> Iterator[Any]:
+    it = iter(rows)
+    ## Keep a bounded number of chunks in flight so rows are consumed lazily
+    max_pending = workers * 2
+    pending: deque[Future] = deque()
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_worker, initargs=(template.to_spec(), options)
+    ) as executor:
+        index = 0
+        while True:
+            while len(pending) < max_pending and (chunk := list(islice(it, chunksize))):
+                if to_shards:
+                    pending.append(executor.submit(_write_shard, index, chunk))
+                else:
+                    pending.append(executor.submit(_render_chunk, chunk))
+                index += 1
+            if not pending:
+                break
+            yield pending.popleft().result()
@@ -0,0 +1,268 @@
+import importlib
+import json
+import re
+import tomllib
+from pathlib import Path
+from threading import RLock
+from types import ModuleType, UnionType
+from typing import Any, Iterator, Literal, Optional, Union, get_args, get_origin
+
+from pydantic import BaseModel
+
+from .template_model import TemplateModel
+
+TEMPLATE_SUFFIXES = (".txt", ".tmpl")
+SPEC_SUFFIXES = (".toml", ".json")
+
+
+def default_class_name(name: str) -> str:
+    """CamelCase class name for a registry entry, e.g. "welcome_email" -> "WelcomeEmail"."""
+    words = [w for w in re.split(r"[^0-9a-zA-Z]+", name) if w]
+    class_name = "".join(w[:1].upper() + w[1:] for w in words) or "Template"
+    if class_name[0].isdigit():
+        class_name = "Template" + class_name
+    return class_name
+
+
+def _load_file(path: Path) -> dict[str, Any]:
+    if path.suffix == ".toml":
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class TemplateRegistry:
+    """Named template specs, built into TemplateModels lazily on first use.
+
+    A spec is a dict of TemplateModel arguments (`template`, `descriptions`,
+    `substitutions`, `class_name`, `class_doc`, ...). Specs with `kind = "llm"`
+    build an LLMTemplateModel and may also set `system_prompt` and `model_name`.
+    Specs without a `class_name` get one derived from their registry name, so the
+    generated model classes are the same in every process. Field types may name
+    other templates in the registry, e.g. `<#author|person|The author#>` or
+    `<#authors|list[person]#>`, which become nested models.
+    """
+
+    def __init__(self, specs: Optional[dict[str, dict[str, Any]]] = None):
+        self._specs: dict[str, dict[str, Any]] = {}
+        self._templates: dict[str, TemplateModel] = {}
+        self._precompiled: dict[str, type[BaseModel]] = {}
+        self._lock = RLock()
+        self._version = 0
+        for name, spec in (specs or {}).items():
+            self.register(name, spec)
+
+    @classmethod
+    def from_manifest(cls, path: Union[str, Path]) -> "TemplateRegistry":
+        """Load specs from a TOML or JSON manifest.
+        The manifest maps names to specs, either at the top level or under a `templates` table.
+        """
+        data = _load_file(Path(path))
+        return cls(data.get("templates", data))
+
+    @classmethod
+    def from_directory(cls, path: Union[str, Path]) -> "TemplateRegistry":
+        """Load every template in a directory, named after the file stem.
+        `.toml`/`.json` files hold a single spec, `.txt`/`.tmpl` files hold the bare template text.
+        """
+        registry = cls()
+        for file in sorted(Path(path).iterdir()):
+            if file.suffix in SPEC_SUFFIXES:
+                registry.register(file.stem, _load_file(file))
+            elif file.suffix in TEMPLATE_SUFFIXES:
+                registry.register(file.stem, {"template": file.read_text(encoding="utf-8")})
+        return registry
+
+    @classmethod
+    def from_module(cls, module: Union[str, ModuleType]) -> "TemplateRegistry":
+        """Load a module written by `compile`, reusing its model classes instead of building them."""
+        if isinstance(module, str):
+            module = importlib.import_module(module)
+        registry = cls(module.TEMPLATES)
+        registry._precompiled.update(module.MODELS)
+        return registry
+
+    def register(self, name: str, spec: Union[dict[str, Any], TemplateModel]) -> None:
+        """Add a spec, or an already built TemplateModel, under `name`."""
+        with self._lock:
+            self._version += 1
+            self._templates.pop(name, None)
+            self._precompiled.pop(name, None)
+            if isinstance(spec, TemplateModel):
+                self._specs[name] = {}
+                self._templates[name] = spec
+                return
+            if "template" not in spec:
+                raise ValueError(f"Template spec '{name}' has no 'template'")
+            spec = dict(spec)
+            spec.setdefault("class_name", default_class_name(name))
+            self._specs[name] = spec
+
+    @property
+    def version(self) -> int:
+        """Bumped by every `register`, so templates can tell when cached type lookups are stale."""
+        return self._version
+
+    def get(self, name: str) -> TemplateModel:
+        """Return the TemplateModel for `name`, building it on first use."""
+        template = self._templates.get(name)
+        if template is not None:
+            return template
+        with self._lock:
+            template = self._templates.get(name)
+            if template is None:
+                if name not in self._specs:
+                    raise KeyError(name)
+                template = self._build(self._specs[name])
+                precompiled = self._precompiled.get(name)
+                if precompiled is not None:
+                    ## Pinned, so the LRU can't evict it when there are many templates
+                    key = template._model_key()[0]
+                    template.model_cache.pin(key, precompiled)
+                self._templates[name] = template
+            return template
+
+    def _build(self, spec: dict[str, Any]) -> TemplateModel:
+        spec = dict(spec)
+        spec.setdefault("types", self)
+        kind = spec.pop("kind", "template")
+        if kind == "llm":
+            from .llm_template_model import LLMTemplateModel
+
+            return LLMTemplateModel(**spec)
+        if kind != "template":
+            raise ValueError(f"Unknown template kind '{kind}'")
+        return TemplateModel(**spec)
+
+    def get_model(self, name: str) -> type[BaseModel]:
+        precompiled = self._precompiled.get(name)
+        if precompiled is not None:
+            ## Building the template pins the class for its own `get_model` too
+            self.get(name)
+            return precompiled
+        return self.get(name).get_model()
+
+    def __getitem__(self, name: str) -> TemplateModel:
+        return self.get(name)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._specs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def __getstate__(self) -> dict[str, Any]:
+        ## Templates refer back to the registry through `types`; ship the specs only
+        ## and let each process build its templates again
+        return {"specs": self._specs, "templates": {
+            name: template for name, template in self._templates.items() if not self._specs[name]
+        }, "precompiled": self._precompiled}
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        self._specs = state["specs"]
+        self._templates = state["templates"]
+        self._precompiled = state["precompiled"]
+        self._lock = RLock()
+        self._version = 0
+
+    def compile(self, path: Union[str, Path]) -> Path:
+        """Write a Python module with a static model class for every template.
+        Load it with `TemplateRegistry.from_module` so production processes import the
+        models instead of creating them at runtime.
+        """
+        lines = [
+            '"""Generated by template_models.TemplateRegistry.compile. Do not edit."""',
+            "",
+            "import datetime",
+            "import decimal",
+            "import typing",
+            "import uuid",
+            "",
+            "from pydantic import BaseModel, Field",
+            "",
+        ]
+        models = {}
+        emitted: dict[str, type[BaseModel]] = {}
+
+        def emit(model: type[BaseModel]) -> None:
+            if emitted.get(model.__name__) is model:
+                return
+            if not model.__name__.isidentifier():
+                raise ValueError(f"Class name '{model.__name__}' is not an identifier")
+            if model.__name__ in emitted:
+                raise ValueError(f"Class name '{model.__name__}' is used by several models")
+            ## Nested models have to be defined before the models using them
+            for field_info in model.model_fields.values():
+                for nested in _nested_models(field_info.annotation):
+                    emit(nested)
+            emitted[model.__name__] = model
+            lines.extend(["", *_model_source(model), ""])
+
+        for name in self:
+            if not self._specs[name]:
+                raise ValueError(f"Template '{name}' was registered as an instance and has no spec")
+            model = self.get_model(name)
+            emit(model)
+            models[name] = model.__name__
+
+        lines += ["", f"TEMPLATES = {self._specs!r}", ""]
+        lines += ["MODELS = {"]
+        lines += [f"    {name!r}: {class_name}," for name, class_name in models.items()]
+        lines += ["}", ""]
+
+        path = Path(path)
+        path.write_text("\n".join(lines), encoding="utf-8")
+        return path
+
+
+def _model_source(model: type[BaseModel]) -> list[str]:
+    lines = [f"class {model.__name__}(BaseModel):"]
+    if model.__doc__:
+        lines.append(f"    __doc__ = {model.__doc__!r}")
+    for field_name, field_info in model.model_fields.items():
+        annotation = annotation_source(field_info.annotation)
+        if field_info.description is not None:
+            default = f"Field(..., description={field_info.description!r})"
+        else:
+            default = "Field(...)"
+        lines.append(f"    {field_name}: {annotation} = {default}")
+    if len(lines) == 1:
+        lines.append("    pass")
+    return lines
+
+
+def _nested_models(annotation: Any) -> Iterator[type[BaseModel]]:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        yield annotation
+        return
+    for arg in get_args(annotation):
+        yield from _nested_models(arg)
+
+
+def annotation_source(annotation: Any) -> str:
+    """Python source for a field annotation, resolvable in a generated module."""
+    if annotation is None or annotation is type(None):
+        return "None"
+    if annotation is Ellipsis:
+        return "..."
+    if annotation is Any:
+        return "typing.Any"
+    origin = get_origin(annotation)
+    if origin is None:
+        if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+            return annotation.__name__
+        if isinstance(annotation, type):
+            if annotation.__module__ == "builtins":
+                return annotation.__qualname__
+            return f"{annotation.__module__}.{annotation.__qualname__}"
+        return repr(annotation)
+    args = get_args(annotation)
+    if origin is Literal:
+        return f"typing.Literal[{', '.join(repr(a) for a in args)}]"
+    if origin is Union or origin is UnionType:
+        return f"typing.Union[{', '.join(annotation_source(a) for a in args)}]"
+    return f"{annotation_source(origin)}[{', '.join(annotation_source(a) for a in args)}]"
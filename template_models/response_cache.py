@@ -0,0 +1,163 @@
+import hashlib
+import json
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional
+
+DEFAULT_RESPONSE_CACHE_SIZE = 1024
+
+
+@dataclass(frozen=True)
+class ResponseCacheInfo:
+    hits: int
+    misses: int
+    currsize: int
+
+
+class ResponseCache(ABC):
+    """Cache of LLM responses, stored as the JSON of the validated pydantic instance.
+    Args:
+        ttl: Seconds an entry stays valid. None keeps entries until evicted or cleared.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        system_prompt: Optional[str],
+        query: str,
+        temperature: float,
+        schema: dict[str, Any],
+    ) -> str:
+        """Stable hash of everything that determines the LLM response."""
+        payload = json.dumps(
+            {
+                "model_name": model_name,
+                "system_prompt": system_prompt,
+                "query": query,
+                "temperature": temperature,
+                "schema": schema,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._get(key, time.time())
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        expires_at = None if self.ttl is None else time.time() + self.ttl
+        self._set(key, value, expires_at)
+
+    def info(self) -> ResponseCacheInfo:
+        return ResponseCacheInfo(hits=self.hits, misses=self.misses, currsize=len(self))
+
+    @abstractmethod
+    def _get(self, key: str, now: float) -> Optional[str]: ...
+
+    @abstractmethod
+    def _set(self, key: str, value: str, expires_at: Optional[float]) -> None: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    @abstractmethod
+    def __len__(self) -> int: ...
+
+
+class InMemoryResponseCache(ResponseCache):
+    """LRU response cache held in process memory."""
+
+    def __init__(self, maxsize: int = DEFAULT_RESPONSE_CACHE_SIZE, ttl: Optional[float] = None):
+        super().__init__(ttl=ttl)
+        self.maxsize = maxsize
+        self._data: OrderedDict[str, tuple[Optional[float], str]] = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value: str, expires_at: Optional[float]) -> None:
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """Response cache persisted to a SQLite database, shareable between processes."""
+
+    def __init__(self, path: str | Path, ttl: Optional[float] = None):
+        super().__init__(ttl=ttl)
+        self.path = Path(path)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+
+    def _get(self, key: str, now: float) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at <= now:
+                with self._conn:
+                    self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return value
+
+    def _set(self, key: str, value: str, expires_at: Optional[float]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at),
+            )
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
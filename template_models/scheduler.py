@@ -0,0 +1,396 @@
+"""Rate limiting, retries and prioritisation for LLM requests.
+
+A `Scheduler` sits between `LLMTemplateModel` and the provider client:
+
+- a token bucket per model name on requests and tokens per minute (`RateLimit`)
+- exponential backoff with full jitter on retryable errors (`RetryPolicy`):
+  429s, 408/409, 5xx, timeouts and connection errors, honouring `Retry-After`
+- a fixed number of request slots handed out by priority, so interactive calls
+  overtake queued batch calls (`Priority`)
+- spill-over to a fallback model name while the recent latency of a model is
+  above its SLO, or when its retries are exhausted
+
+Provider clients retry on their own as well; create them with `max_retries=0`
+(e.g. `ClientPool(client_params={"max_retries": 0})`) to leave retries to the scheduler.
+"""
+
+import asyncio
+import heapq
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from itertools import count
+from threading import Event, Lock
+from typing import Awaitable, Callable, Optional, TypeVar
+
+from .instrumentation import _percentile
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429, 500, 502, 503, 504, 529})
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+@dataclass(frozen=True)
+class RateLimit:
+    """Per-model budget. None leaves that dimension unlimited."""
+
+    requests_per_minute: Optional[float] = None
+    tokens_per_minute: Optional[float] = None
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt n sleeps up to `base_delay * 2**n`."""
+
+    max_retries: int = 5
+    base_delay: float = 0.5
+    max_delay: float = 30.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `rate` per second.
+
+    `reserve` always succeeds and returns how long the caller has to wait before
+    using what it reserved, so waiters are served in the order they reserved.
+    """
+
+    def __init__(
+        self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic
+    ):
+        if rate <= 0:
+            raise ValueError(f"rate must be > 0, got {rate}")
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self._tokens = capacity
+        self._last = clock()
+        self._lock = Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= amount
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def adjust(self, amount: float) -> None:
+        """Give back (positive) or take (negative) tokens after the real cost is known."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + amount)
+
+
+class _PriorityGate:
+    """A fixed number of slots, handed out lowest priority value first, then FIFO.
+    Sync callers wait on an Event, async callers on a future of their own loop.
+    """
+
+    def __init__(self, slots: int):
+        self._free = slots
+        self._lock = Lock()
+        self._waiters: list[tuple[int, int, Callable[[], bool]]] = []
+        self._seq = count()
+
+    def _enter(self, priority: int, wake: Callable[[], bool]) -> bool:
+        with self._lock:
+            if self._free > 0 and not self._waiters:
+                self._free -= 1
+                return True
+            heapq.heappush(self._waiters, (priority, next(self._seq), wake))
+            return False
+
+    def acquire(self, priority: int) -> None:
+        event = Event()
+
+        def wake() -> bool:
+            event.set()
+            return True
+
+        if not self._enter(priority, wake):
+            event.wait()
+
+    async def aacquire(self, priority: int) -> None:
+        loop = asyncio.get_running_loop()
+        future: asyncio.Future = loop.create_future()
+
+        def hand_over() -> None:
+            ## A waiter cancelled in the meantime passes its slot on
+            if future.done():
+                self.release()
+            else:
+                future.set_result(None)
+
+        def wake() -> bool:
+            try:
+                loop.call_soon_threadsafe(hand_over)
+            except RuntimeError:
+                ## The waiter's loop is gone
+                return False
+            return True
+
+        if not self._enter(priority, wake):
+            await future
+
+    def release(self) -> None:
+        while True:
+            with self._lock:
+                if not self._waiters:
+                    self._free += 1
+                    return
+                _, _, wake = heapq.heappop(self._waiters)
+            if wake():
+                return
+
+
+@dataclass
+class _ModelState:
+    request_bucket: Optional[TokenBucket]
+    token_bucket: Optional[TokenBucket]
+    latencies: deque = field(default_factory=lambda: deque(maxlen=50))
+    lock: Lock = field(default_factory=Lock)
+
+
+def _retry_info(error: BaseException) -> tuple[bool, Optional[float]]:
+    """Whether `error` (or an exception it wraps) is worth retrying, and its Retry-After."""
+    seen = set()
+    exc: Optional[BaseException] = error
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        status = getattr(exc, "status_code", None)
+        if isinstance(status, int):
+            retry_after = None
+            headers = getattr(getattr(exc, "response", None), "headers", None)
+            if headers is not None:
+                try:
+                    retry_after = float(headers.get("retry-after"))
+                except (TypeError, ValueError):
+                    pass
+            return status in RETRYABLE_STATUS_CODES, retry_after
+        name = type(exc).__name__
+        if isinstance(exc, (TimeoutError, ConnectionError)):
+            return True, None
+        if "Timeout" in name or "Connection" in name:
+            return True, None
+        exc = exc.__cause__ or exc.__context__
+    return False, None
+
+
+class Scheduler:
+    """Runs LLM requests under per-model rate limits, retries and priorities.
+
+    Args:
+        limits: RateLimit per model name.
+        default_limit: RateLimit for model names not in `limits`. None means unlimited.
+        retry: Backoff policy for retryable errors.
+        max_concurrency: Number of requests in flight at once, across every model.
+        fallbacks: Model name to spill over to, per model name.
+        latency_slo: Seconds. While the recent p95 latency of a model is above it,
+            new requests go to its fallback. Latency is the time spent in the request
+            itself, excluding time queued or throttled by the scheduler.
+        slo_window: Seconds a latency sample counts towards the SLO check, so a model
+            that was spilled over gets tried again afterwards.
+    """
+
+    def __init__(
+        self,
+        limits: Optional[dict[str, RateLimit]] = None,
+        default_limit: Optional[RateLimit] = None,
+        retry: Optional[RetryPolicy] = None,
+        max_concurrency: int = 16,
+        fallbacks: Optional[dict[str, str]] = None,
+        latency_slo: Optional[float] = None,
+        slo_window: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_concurrency < 1:
+            raise ValueError(f"max_concurrency must be >= 1, got {max_concurrency}")
+        self.limits = dict(limits or {})
+        self.default_limit = default_limit
+        self.retry = retry or RetryPolicy()
+        self.fallbacks = dict(fallbacks or {})
+        self.latency_slo = latency_slo
+        self.slo_window = slo_window
+        self.clock = clock
+        self._gate = _PriorityGate(max_concurrency)
+        self._models: dict[str, _ModelState] = {}
+        self._lock = Lock()
+
+    def _state(self, model_name: str) -> _ModelState:
+        state = self._models.get(model_name)
+        if state is not None:
+            return state
+        with self._lock:
+            state = self._models.get(model_name)
+            if state is None:
+                limit = self.limits.get(model_name, self.default_limit) or RateLimit()
+                state = self._models[model_name] = _ModelState(
+                    request_bucket=_bucket(limit.requests_per_minute, self.clock),
+                    token_bucket=_bucket(limit.tokens_per_minute, self.clock),
+                )
+            return state
+
+    def slo_breached(self, model_name: str) -> bool:
+        """Whether the recent p95 latency of `model_name` is above the SLO."""
+        if self.latency_slo is None:
+            return False
+        state = self._state(model_name)
+        horizon = self.clock() - self.slo_window
+        with state.lock:
+            while state.latencies and state.latencies[0][0] < horizon:
+                state.latencies.popleft()
+            values = sorted(latency for _, latency in state.latencies)
+        return bool(values) and _percentile(values, 95) > self.latency_slo
+
+    def route(self, model_name: str) -> str:
+        """The model name a new request for `model_name` should go to."""
+        fallback = self.fallbacks.get(model_name)
+        if fallback is not None and self.slo_breached(model_name):
+            logger.info("Latency SLO breached for %s, using %s", model_name, fallback)
+            return fallback
+        return model_name
+
+    def _record_latency(self, model_name: str, latency: float) -> None:
+        state = self._state(model_name)
+        with state.lock:
+            state.latencies.append((self.clock(), latency))
+
+    def _reserve(self, model_name: str, tokens: int) -> float:
+        state = self._state(model_name)
+        wait = 0.0
+        if state.request_bucket is not None:
+            wait = max(wait, state.request_bucket.reserve(1))
+        if state.token_bucket is not None and tokens:
+            wait = max(wait, state.token_bucket.reserve(tokens))
+        return wait
+
+    def _settle(self, model_name: str, estimated: int, actual: Optional[int]) -> None:
+        state = self._state(model_name)
+        if state.token_bucket is not None and actual is not None:
+            state.token_bucket.adjust(estimated - actual)
+
+    def _next_model(
+        self, model_name: str, error: BaseException, attempt: int
+    ) -> Optional[tuple[str, float]]:
+        """The model and delay for the next attempt, or None to give up."""
+        retryable, retry_after = _retry_info(error)
+        if not retryable:
+            return None
+        if attempt < self.retry.max_retries:
+            delay = self.retry.delay(attempt, retry_after)
+            logger.warning(
+                "Request to %s failed (%s), retrying in %.2fs", model_name, error, delay
+            )
+            return model_name, delay
+        fallback = self.fallbacks.get(model_name)
+        if fallback is not None and attempt == self.retry.max_retries:
+            logger.warning(
+                "Request to %s failed (%s), falling back to %s", model_name, error, fallback
+            )
+            return fallback, 0.0
+        return None
+
+    def call(
+        self,
+        model_name: str,
+        request: Callable[[str], T],
+        tokens: int = 0,
+        priority: int = Priority.INTERACTIVE,
+        usage: Optional[Callable[[T], Optional[int]]] = None,
+    ) -> T:
+        """Run `request(model_name)` under the scheduler and return its result.
+        Args:
+            model_name: The requested model; the request may be routed to its fallback.
+            request: Makes the call for the model name it is given.
+            tokens: Estimated tokens of the request, reserved from the token budget.
+            priority: Lower values are served first when every slot is busy.
+            usage: Returns the real token count of a result, to correct the reservation.
+        """
+        model = self.route(model_name)
+        self._gate.acquire(priority)
+        try:
+            attempt = 0
+            while True:
+                wait = self._reserve(model, tokens)
+                if wait > 0:
+                    time.sleep(wait)
+                ## Only the request itself counts towards the latency SLO, not the
+                ## scheduler's own queueing, throttling and backoff
+                start = self.clock()
+                try:
+                    result = request(model)
+                except Exception as e:
+                    self._record_latency(model, self.clock() - start)
+                    self._settle(model, tokens, 0)
+                    step = self._next_model(model, e, attempt)
+                    if step is None:
+                        raise
+                    model, delay = step
+                    attempt += 1
+                    time.sleep(delay)
+                    continue
+                self._record_latency(model, self.clock() - start)
+                self._settle(model, tokens, usage(result) if usage else None)
+                return result
+        finally:
+            self._gate.release()
+
+    async def acall(
+        self,
+        model_name: str,
+        request: Callable[[str], Awaitable[T]],
+        tokens: int = 0,
+        priority: int = Priority.INTERACTIVE,
+        usage: Optional[Callable[[T], Optional[int]]] = None,
+    ) -> T:
+        """Async version of `call`; `request` returns an awaitable."""
+        model = self.route(model_name)
+        await self._gate.aacquire(priority)
+        try:
+            attempt = 0
+            while True:
+                wait = self._reserve(model, tokens)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                ## Only the request itself counts towards the latency SLO, not the
+                ## scheduler's own queueing, throttling and backoff
+                start = self.clock()
+                try:
+                    result = await request(model)
+                except Exception as e:
+                    self._record_latency(model, self.clock() - start)
+                    self._settle(model, tokens, 0)
+                    step = self._next_model(model, e, attempt)
+                    if step is None:
+                        raise
+                    model, delay = step
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                self._record_latency(model, self.clock() - start)
+                self._settle(model, tokens, usage(result) if usage else None)
+                return result
+        finally:
+            self._gate.release()
+
+
+def _bucket(per_minute: Optional[float], clock: Callable[[], float]) -> Optional[TokenBucket]:
+    if per_minute is None:
+        return None
+    ## Allow a minute's worth of burst, refilled evenly over the minute
+    return TokenBucket(per_minute / 60.0, per_minute, clock)
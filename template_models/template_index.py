@@ -0,0 +1,148 @@
+"""Match text back to the template that produced it and recover its fields."""
+
+import re
+from threading import Lock
+from typing import TYPE_CHECKING, Any, Mapping, NamedTuple, Optional
+
+from pydantic import BaseModel
+
+from .template_model import TemplateModel, _validate_text_values
+
+if TYPE_CHECKING:
+    from .llm_template_model import LLMTemplateModel
+    from .registry import TemplateRegistry
+
+
+class TemplateMatch(NamedTuple):
+    name: str
+    template: TemplateModel
+    instance: BaseModel
+
+
+## (template name, (group name, field name) pairs)
+_Entry = tuple[str, tuple[tuple[str, str], ...]]
+
+
+def _literal_length(template: TemplateModel) -> int:
+    return sum(len(seg) for seg in template.compiled.segments if type(seg) is str)
+
+
+class TemplateIndex:
+    """Many templates compiled into one regex, so a single scan finds the template a
+    text was rendered from and extracts its fields through the template's cached model.
+
+    Templates with more literal text are tried first. When the first matching template's
+    values don't validate, the remaining templates are tried one by one. `extract` can
+    fall back to an LLM extraction for text no template matches.
+    """
+
+    def __init__(self, templates: Optional[Mapping[str, TemplateModel]] = None):
+        self._templates: dict[str, TemplateModel] = {}
+        self._llm_templates: dict[str, "LLMTemplateModel"] = {}
+        self._compiled: Optional[tuple[re.Pattern, list[_Entry]]] = None
+        self._lock = Lock()
+        for name, template in (templates or {}).items():
+            self.add(name, template)
+
+    @classmethod
+    def from_registry(cls, registry: "TemplateRegistry") -> "TemplateIndex":
+        """Index every template of a registry (building them if needed)."""
+        return cls({name: registry.get(name) for name in registry})
+
+    def add(self, name: str, template: TemplateModel) -> None:
+        with self._lock:
+            self._templates[name] = template
+            self._llm_templates.pop(name, None)
+            self._compiled = None
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._templates
+
+    def __len__(self) -> int:
+        return len(self._templates)
+
+    def _get_compiled(self) -> tuple[re.Pattern, list[_Entry]]:
+        compiled = self._compiled
+        if compiled is not None:
+            return compiled
+        with self._lock:
+            if self._compiled is None:
+                templates = self._templates
+                names = sorted(templates, key=lambda n: -_literal_length(templates[n]))
+                parts = []
+                entries = []
+                for i, name in enumerate(names):
+                    template = templates[name]
+                    source, groups = template.compiled.pattern(template.substitutions, f"t{i}_")
+                    parts.append(f"(?P<t{i}>{source})")
+                    entries.append((name, groups))
+                self._compiled = (re.compile("|".join(parts), re.DOTALL), entries)
+            return self._compiled
+
+    def match(self, text: str) -> Optional[TemplateMatch]:
+        """Find the template `text` was rendered from and recover the model instance.
+        Returns:
+            The match, or None if no template matches with values that validate.
+        """
+        if not self._templates:
+            return None
+        pattern, entries = self._get_compiled()
+        m = pattern.fullmatch(text)
+        if m is None:
+            return None
+        first = int(m.lastgroup[1:])  # type: ignore
+        name, groups = entries[first]
+        template = self._templates[name]
+        instance = _validate_text_values(
+            template.get_model(), {field: m.group(group) for group, field in groups}
+        )
+        if instance is not None:
+            return TemplateMatch(name, template, instance)
+        ## The text fits an earlier template's shape but not its types; try the rest
+        for name, _ in entries[first + 1 :]:
+            template = self._templates[name]
+            instance = template.parse_text(text)
+            if instance is not None:
+                return TemplateMatch(name, template, instance)
+        return None
+
+    def extract(
+        self, text: str, fallback: Optional[str] = None, **kwargs: Any
+    ) -> Optional[TemplateMatch]:
+        """Like `match`, but text no template matches is extracted by an LLM.
+        Args:
+            text: The text to extract from.
+            fallback: Name of the template to extract with when nothing matches. Plain
+                TemplateModels are turned into an LLMTemplateModel with the same spec.
+            kwargs: Extra arguments passed to `LLMTemplateModel.generate_instance`.
+        Returns:
+            The match, or None if nothing matches and there is no fallback.
+        """
+        match = self.match(text)
+        if match is not None or fallback is None:
+            return match
+        instance = self._llm_template(fallback).generate_instance(text, **kwargs)
+        return TemplateMatch(fallback, self._templates[fallback], instance)
+
+    async def aextract(
+        self, text: str, fallback: Optional[str] = None, **kwargs: Any
+    ) -> Optional[TemplateMatch]:
+        """Async version of `extract`."""
+        match = self.match(text)
+        if match is not None or fallback is None:
+            return match
+        instance = await self._llm_template(fallback).agenerate_instance(text, **kwargs)
+        return TemplateMatch(fallback, self._templates[fallback], instance)
+
+    def _llm_template(self, name: str) -> "LLMTemplateModel":
+        from .llm_template_model import LLMTemplateModel
+
+        llm_template = self._llm_templates.get(name)
+        if llm_template is None:
+            template = self._templates[name]
+            if isinstance(template, LLMTemplateModel):
+                llm_template = template
+            else:
+                llm_template = LLMTemplateModel.from_spec(template.to_spec())
+            self._llm_templates[name] = llm_template  # type: ignore
+        return llm_template  # type: ignore
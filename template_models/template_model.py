@@ -1,12 +1,39 @@
+import ast
+import hashlib
+import io
+import json
+import mmap
 import re
-from dataclasses import dataclass, field
-from typing import Any, Optional
-from uuid import uuid4
+from dataclasses import FrozenInstanceError, dataclass, field, fields
+from pathlib import Path
+from functools import lru_cache
+from itertools import islice
+from threading import Lock
+from types import MappingProxyType
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    ClassVar,
+    Iterable,
+    Iterator,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Union,
+)
 
-from pydantic import BaseModel, Field, create_model
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError, create_model
 
-# Mapping of string data type to actual Python type
-type_mapping = {"str": str, "int": int, "float": float, "bool": bool, "list": list, "dict": dict}
+from .compiled_template import CompiledTemplate, compile_template
+from .instrumentation import enabled as instrumentation_enabled
+from .instrumentation import span
+from .model_cache import DEFAULT_MODEL_CACHE_SIZE, CacheInfo, ModelCache
+from .type_parser import referenced_names, resolve_type, resolving, type_mapping
+
+if TYPE_CHECKING:
+    from .columnar import Column
 
 
 class SafeDict(dict):
@@ -15,6 +42,149 @@ class SafeDict(dict):
 
 
 DEFAULT_FIELD_REGEX = r"<#(.*?)#>"
+DEFAULT_BATCH_SIZE = 1024
+
+
+class FieldStructure(NamedTuple):
+    name: str
+    type_str: Optional[str]
+    ## Type resolved without a `types` namespace
+    field_type: Any
+    ## Description from the field spec, may still contain placeholders
+    description: Optional[str]
+    typed: bool = True
+
+
+@lru_cache(maxsize=1024)
+def _get_structure(template: str, field_regex: str) -> Optional[tuple[FieldStructure, ...]]:
+    """The substitution-independent part of a template's model: field names, types and order.
+    Returns None when a field name or type contains a placeholder, since those
+    can only be known after formatting the template.
+    """
+    structure: dict[str, FieldStructure] = {}
+    for spec in compile_template(template, field_regex).fields:
+        if "{" in spec.name or (spec.type_str and "{" in spec.type_str):
+            return None
+        field_type = resolve_type(spec.type_str, extended=spec.typed)
+        structure[spec.name] = FieldStructure(
+            spec.name, spec.type_str, field_type, spec.description, spec.typed
+        )
+    return tuple(structure.values())
+
+
+def _inserts_fields(substitutions: Mapping[str, Any], field_regex: str) -> bool:
+    """Whether a substitution value adds field specs to the template when formatted."""
+    search = re.compile(field_regex).search
+    return any(isinstance(v, str) and search(v) for v in substitutions.values())
+
+
+def _get_write(writer: IO[Any], encoding: str) -> Callable[[str], Any]:
+    """Return a callable writing text to `writer`, encoding it first for binary writers."""
+    if isinstance(writer, io.TextIOBase):
+        return writer.write
+    if isinstance(writer, (io.RawIOBase, io.BufferedIOBase)) or "b" in getattr(writer, "mode", ""):
+        write = writer.write
+        return lambda text: write(text.encode(encoding))
+    return writer.write
+
+
+def _hash(payload: dict[str, Any]) -> str:
+    data = json.dumps(payload, sort_keys=True, default=repr, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def _thaw(value: Any) -> Any:
+    """A plain dict for the read-only mappings of a frozen template."""
+    return dict(value) if isinstance(value, MappingProxyType) else value
+
+
+def _default_class_name(fingerprint: str) -> str:
+    return f"DynamicModel_{fingerprint[:12]}"
+
+
+def _type_identity(value: Any) -> str:
+    """A process-independent name for a `types` entry."""
+    if callable(getattr(value, "fingerprint", None)):
+        return value.fingerprint()
+    if isinstance(value, type):
+        return f"{value.__module__}.{value.__qualname__}"
+    return repr(value)
+
+
+@lru_cache(maxsize=1024)
+def _get_text_parser(
+    template: str, field_regex: str, substitutions: tuple[tuple[str, Any], ...]
+) -> tuple[re.Pattern, tuple[tuple[str, str], ...]]:
+    source, groups = compile_template(template, field_regex).pattern(dict(substitutions))
+    return re.compile(source, re.DOTALL), groups
+
+
+def _validate_text_values(model: type[BaseModel], values: dict[str, str]) -> Optional[BaseModel]:
+    """Validate field values recovered from rendered text, or None if they don't fit the model."""
+    try:
+        return model.model_validate(values)
+    except ValidationError as e:
+        invalid = {error["loc"][0] for error in e.errors() if error["loc"]}
+    ## Values are rendered with str(), which is the literal form of lists, dicts, None, ...
+    values = dict(values)
+    for name in invalid:
+        if name not in values:
+            return None
+        try:
+            values[name] = ast.literal_eval(values[name])  # type: ignore
+        except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+            return None
+    try:
+        return model.model_validate(values)
+    except ValidationError:
+        return None
+
+
+JsonLines = Union[str, bytes, bytearray, mmap.mmap, IO[bytes], Iterable[bytes]]
+
+
+def _iter_json_lines(source: JsonLines) -> Iterator[bytes]:
+    """Yield the non-blank lines of JSONL text or bytes, an mmap, a file or an iterable of lines."""
+    if isinstance(source, str):
+        ## Iterating a str would yield characters, not lines
+        source = source.encode("utf-8")
+    if isinstance(source, (bytes, bytearray, mmap.mmap)):
+        ## Scan the buffer in place; only each line is copied out
+        pos, end = 0, len(source)
+        while pos < end:
+            nl = source.find(b"\n", pos)
+            if nl == -1:
+                nl = end
+            line = source[pos:nl]
+            pos = nl + 1
+            if line.strip():
+                yield line
+        return
+    for line in source:
+        if line.strip():
+            yield line
+
+
+@lru_cache(maxsize=DEFAULT_MODEL_CACHE_SIZE)
+def _extra_model(model: type[BaseModel]) -> type[BaseModel]:
+    """Subclass of `model` that keeps keys which aren't fields in `__pydantic_extra__`."""
+    namespace = {
+        "model_config": {**model.model_config, "extra": "allow"},
+        "__module__": model.__module__,
+        "__doc__": model.__doc__,
+    }
+    return type(model.__name__, (model,), namespace)  # type: ignore
+
+
+def _json_data(instance: BaseModel) -> dict[str, Any]:
+    """The values `{key}` slots can use: the fields and any extra keys of the record."""
+    extra = instance.__pydantic_extra__
+    return {**extra, **instance.__dict__} if extra else instance.__dict__
+
+
+@lru_cache(maxsize=DEFAULT_MODEL_CACHE_SIZE)
+def _list_adapter(model: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(list[model])  # type: ignore
 
 
 @dataclass
@@ -26,16 +196,120 @@ class TemplateModel:
     delayed_substitution: Optional[bool] = False
     class_name: Optional[str] = None
     class_doc: Optional[str] = None
+    ## Extra type names for field specs, e.g. other templates used as nested models
+    types: Optional[Mapping[str, Any]] = field(default=None, repr=False, compare=False)
+
+    ## Shared by every TemplateModel in the process
+    model_cache: ClassVar[ModelCache] = ModelCache()
+    ## Set on the instance by `freeze`
+    _frozen: ClassVar[bool] = False
 
     def __post_init__(self):
-        if not self.class_name:
-            self.class_name = f"DynamicModel_{uuid4().hex[:8]}"
         if self.substitutions:
             self.template = self._format(self.template, self.substitutions)
             if self.descriptions:
                 self.descriptions = {
                     k: self._format(v, self.substitutions) for k, v in self.descriptions.items()
                 }
+        if not self.class_name:
+            ## Content-addressed, so the same template gets the same class in every process
+            self.class_name = _default_class_name(self._content_fingerprint())
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if self._frozen:
+            raise FrozenInstanceError(f"cannot assign to field '{name}' of a frozen template")
+        object.__setattr__(self, name, value)
+
+    def freeze(self) -> "TemplateModel":
+        """Make the template immutable, so one instance can be shared by many threads.
+        Assigning a field raises `dataclasses.FrozenInstanceError` and `descriptions`
+        and `substitutions` become read-only mappings. The default model (`get_model()`
+        without arguments, used by every render that doesn't override substitutions,
+        class name or doc) is built once on first use, under a lock, and then returned
+        without touching the shared model cache or its lock.
+        Returns:
+            The template itself.
+        """
+        if self._frozen:
+            return self
+        for name in ("descriptions", "substitutions"):
+            value = getattr(self, name)
+            if value is not None:
+                object.__setattr__(self, name, MappingProxyType(dict(value)))
+        object.__setattr__(self, "_default_model", None)
+        object.__setattr__(self, "_init_lock", Lock())
+        object.__setattr__(self, "_frozen", True)
+        return self
+
+    @property
+    def frozen(self) -> bool:
+        return self._frozen
+
+    def __getstate__(self) -> dict[str, Any]:
+        state = dict(self.__dict__)
+        ## Holds generated model classes, which don't pickle
+        state.pop("_field_types", None)
+        if state.get("_frozen"):
+            ## Locks and mapping proxies don't pickle; `__setstate__` freezes again
+            del state["_default_model"], state["_init_lock"]
+            state["descriptions"] = _thaw(state["descriptions"])
+            state["substitutions"] = _thaw(state["substitutions"])
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        frozen = state.pop("_frozen", False)
+        self.__dict__.update(state)
+        if frozen:
+            self.freeze()
+
+    def fingerprint(self) -> str:
+        """Stable hex digest of everything that shapes the generated model and text:
+        the template, descriptions, substitutions, regex, class doc, the types it refers
+        to and the remaining comparable fields (e.g. `system_prompt`, `model_name`).
+        The class name only counts when it was given explicitly. Equal templates have
+        equal fingerprints across processes and restarts.
+        """
+        digest = self._content_fingerprint()
+        if self.class_name == _default_class_name(digest):
+            return digest
+        return _hash({"content": digest, "class_name": self.class_name})
+
+    def _content_fingerprint(self) -> str:
+        payload = {
+            f.name: _thaw(getattr(self, f.name))
+            for f in fields(self)
+            if f.compare and f.name != "class_name"
+        }
+        if self.types:
+            names = set()
+            for spec in self.compiled.fields:
+                names |= referenced_names(spec.type_str)
+            payload["types"] = {}
+            for name in sorted(names):
+                if name in self.types:
+                    value = self.types[name]
+                    with resolving(name, value):
+                        payload["types"][name] = _type_identity(value)
+        return _hash(payload)
+
+    def to_spec(self) -> dict[str, Any]:
+        """Compact, picklable description of this template (TemplateModel fields only)."""
+        return {f.name: _thaw(getattr(self, f.name)) for f in fields(TemplateModel)}
+
+    @classmethod
+    def from_spec(cls, spec: dict[str, Any]) -> "TemplateModel":
+        """Rebuild a template from `to_spec` output.
+        The spec already holds the formatted template, so `__post_init__` is not run again.
+        """
+        template = cls.__new__(cls)
+        for name, value in spec.items():
+            object.__setattr__(template, name, value)
+        return template
+
+    @property
+    def compiled(self) -> CompiledTemplate:
+        """The template parsed into literal, field and substitution segments."""
+        return compile_template(self.template, self.field_regex)
 
     def _extract_field_definitions(
         self, template, descriptions: Optional[dict[str, str]] = None
@@ -43,23 +317,12 @@ class TemplateModel:
         """Extract field definitions from the template string."""
         if descriptions is None:
             descriptions = {}
-        matches = re.findall(self.field_regex, template)
         field_definitions = {}
-        for match in matches:
-            parts = match.split("|")
-            description = descriptions.get(parts[0], None)
-            if len(parts) == 3:
-                name, type_str, description = parts
-                field_type = type_mapping.get(
-                    type_str, str
-                )  # Default to str if type is not recognized
-            elif len(parts) == 2:
-                name, description = parts
-                assert description
-                field_type = type_mapping.get(description, str)
-            else:
-                name = parts[0]
-                field_type = str
+        for spec in compile_template(template, self.field_regex).fields:
+            name = spec.name
+            description = spec.description or descriptions.get(name, None)
+            # Default to str if type is not recognized
+            field_type = resolve_type(spec.type_str, self.types, extended=spec.typed)
             if description:
                 field_definitions[name] = (field_type, Field(..., description=description))
             else:
@@ -114,30 +377,180 @@ class TemplateModel:
         class_doc: Optional[str] = None,
     ) -> type[BaseModel]:
         """Get the Pydantic model class based on the template string.
+        Generated classes are cached, so repeated calls with the same effective
+        template, descriptions, class name and class doc return the same class.
         Args:
             substitutions: A dictionary of substitutions to apply to the template string and fields.
         Returns:
             The Pydantic model class.
         """
+        if self._frozen and not substitutions and not class_name and not class_doc:
+            ## Double-checked, so the common path is a single attribute read
+            DynamicModel = self._default_model
+            if DynamicModel is None:
+                with self._init_lock:
+                    DynamicModel = self._default_model
+                    if DynamicModel is None:
+                        DynamicModel = self._get_model(None, None, None)
+                        object.__setattr__(self, "_default_model", DynamicModel)
+            return DynamicModel
+        return self._get_model(substitutions, class_name, class_doc)
+
+    def _get_model(
+        self,
+        substitutions: Optional[dict[str, Any]],
+        class_name: Optional[str],
+        class_doc: Optional[str],
+    ) -> type[BaseModel]:
+        key, field_definitions_factory = self._model_key(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        class_name, class_doc = key[3], key[4]
+
+        with span("create_model", class_name) as s:
+            DynamicModel = self.model_cache.get(key)
+            s.set(cache_hit=DynamicModel is not None)
+            if DynamicModel is None:
+                with span("parse", class_name):
+                    field_definitions = field_definitions_factory()
+                DynamicModel = create_model(class_name, **field_definitions)  # type: ignore
+                if class_doc:
+                    DynamicModel.__doc__ = class_doc
+                self.model_cache.put(key, DynamicModel)
+        return DynamicModel
+
+    def _model_key(
+        self,
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+    ) -> tuple[tuple, Callable[[], dict[str, tuple[type, Any]]]]:
+        """Build the model cache key for the given substitutions.
+        Field names, types and order come from the cached template structure, so
+        only descriptions and the class doc that contain placeholders are formatted.
+        Returns:
+            The cache key and a function building the field definitions on a cache miss.
+        """
         substitutions = substitutions or self.substitutions
         substitutions = substitutions or {}
         class_name = class_name or self.class_name
         class_doc = class_doc or self.class_doc
 
-        templ = self._format(self.template, substitutions)
+        structure = _get_structure(self.template, self.field_regex)
+        if structure is None or _inserts_fields(substitutions, self.field_regex):
+            return self._formatted_model_key(substitutions, class_name, class_doc)
 
-        new_descriptions = {}
-        if self.descriptions is not None:
-            for k, v in self.descriptions.items():
-                new_descriptions[k] = self._format(v, substitutions)
-        field_definitions = self._extract_field_definitions(templ, new_descriptions)
-        DynamicModel = create_model(class_name, **field_definitions)  # type: ignore
+        with span("format", class_name):
+            if not self.delayed_substitution:
+                missing = self.compiled.sub_keys.difference(substitutions)
+                if missing:
+                    raise KeyError(min(missing))
+            descriptions = self.descriptions or {}
+            new_descriptions = {}
+            for f in structure:
+                description = f.description or descriptions.get(f.name)
+                if description:
+                    if "{" in description or "}" in description:
+                        description = self._format(description, substitutions)
+                    new_descriptions[f.name] = description
+            if class_doc and ("{" in class_doc or "}" in class_doc):
+                class_doc = self._format(class_doc, substitutions)
 
-        if class_doc:
-            class_doc = self._format(class_doc, substitutions)
-            DynamicModel.__doc__ = class_doc
+        if self.types:
+            field_types = self._resolve_field_types(structure)
+        else:
+            field_types = tuple(f.field_type for f in structure)
 
-        return DynamicModel
+        key = (
+            self.field_regex,
+            self.template,
+            tuple(new_descriptions.items()),
+            class_name,
+            class_doc,
+            field_types,
+        )
+
+        def field_definitions() -> dict[str, tuple[type, Any]]:
+            return {
+                f.name: (
+                    (field_type, Field(..., description=new_descriptions[f.name]))
+                    if f.name in new_descriptions
+                    else (field_type, ...)
+                )
+                for f, field_type in zip(structure, field_types)
+            }
+
+        return key, field_definitions
+
+    def _resolve_field_types(self, structure: tuple[FieldStructure, ...]) -> tuple[Any, ...]:
+        """The field types of `structure` resolved against `types`.
+        Resolutions are cached on the instance and reused while the namespace `version`
+        (bumped by `TemplateRegistry.register`) and the namespace entries the fields
+        refer to are unchanged, so nested templates aren't asked for their models again.
+        """
+        types = self.types
+        cache: Optional[dict] = self.__dict__.get("_field_types")
+        if cache is None:
+            cache = {}
+            object.__setattr__(self, "_field_types", cache)
+        version = getattr(types, "version", None)
+        entry = cache.get(structure)
+        if entry is not None:
+            names, cached_version, refs, field_types = entry
+            if cached_version == version and all(
+                (types[name] if name in types else None) is ref  # type: ignore
+                for name, ref in zip(names, refs)
+            ):
+                return field_types
+        names = tuple(sorted(set().union(*(referenced_names(f.type_str) for f in structure))))
+        refs = tuple(types[name] if name in types else None for name in names)  # type: ignore
+        field_types = tuple(
+            resolve_type(f.type_str, types, extended=f.typed) for f in structure
+        )
+        cache[structure] = (names, version, refs, field_types)
+        return field_types
+
+    def _formatted_model_key(
+        self, substitutions: dict[str, Any], class_name: Optional[str], class_doc: Optional[str]
+    ) -> tuple[tuple, Callable[[], dict[str, tuple[type, Any]]]]:
+        """`_model_key` for templates whose field names or types contain placeholders."""
+        with span("format", class_name) as s:
+            templ = self._format(self.template, substitutions)
+
+            new_descriptions = {}
+            if self.descriptions is not None:
+                for k, v in self.descriptions.items():
+                    new_descriptions[k] = self._format(v, substitutions)
+            if class_doc:
+                class_doc = self._format(class_doc, substitutions)
+            s.set(size=len(templ))
+
+        key = (
+            self.field_regex,
+            templ,
+            tuple(new_descriptions.items()),
+            class_name,
+            class_doc,
+            (
+                tuple(
+                    resolve_type(spec.type_str, self.types, extended=spec.typed)
+                    for spec in compile_template(templ, self.field_regex).fields
+                )
+                if self.types
+                else None
+            ),
+        )
+        return key, lambda: self._extract_field_definitions(templ, new_descriptions)
+
+    @classmethod
+    def clear_cache(cls) -> None:
+        """Drop every cached model class and reset the cache counters."""
+        cls.model_cache.clear()
+
+    @classmethod
+    def cache_info(cls) -> CacheInfo:
+        """Return hit/miss/eviction counters for the shared model cache."""
+        return cls.model_cache.info()
 
     def get_instance(
         self,
@@ -145,18 +558,24 @@ class TemplateModel:
         substitutions: Optional[dict[str, Any]] = None,
         class_name: Optional[str] = None,
         class_doc: Optional[str] = None,
+        validate: bool = True,
     ) -> BaseModel:
         """Get an instance of the Pydantic model based on the data.
         Args:
             data: A dictionary of field values.
             substitutions: A dictionary of substitutions to apply to the template string and fields.
+            validate: Validate the data. With False the instance is built with
+                `model_construct`, which trusts the data as is.
         Returns:
             An instance of the Pydantic model.
         """
         DynamicModel = self.get_model(
             substitutions=substitutions, class_name=class_name, class_doc=class_doc
         )
-        model_instance = DynamicModel(**data)
+        if not validate:
+            return DynamicModel.model_construct(**data)
+        with span("validate", DynamicModel.__name__):
+            model_instance = DynamicModel(**data)
         return model_instance
 
     def get_text_from_instance(
@@ -173,22 +592,17 @@ class TemplateModel:
         Returns:
             The generated text string.
         """
-
-        def replace_match(match):
-            field_name = match.group(1).split("|")[0]
-            return str(getattr(model_instance, field_name))
-
         if substitutions is None:
             substitutions = self.substitutions
-        if substitutions is None:
-            substitutions = {}
-        substituted_string = re.sub(self.field_regex, replace_match, self.template)
-        ## Also substitute the data
-        if substitutions:
-            substituted_string = self._format(substituted_string, substitutions)
-        if data:
-            substituted_string = self._format(substituted_string, data)
-        return substituted_string
+        with span("render", type(model_instance).__name__) as s:
+            text = self.compiled.render(
+                model_instance,
+                substitutions=substitutions,
+                data=data,
+                allow_unknown=bool(self.delayed_substitution),
+            )
+            s.set(size=len(text))
+        return text
 
     def get_text(
         self,
@@ -196,15 +610,528 @@ class TemplateModel:
         substitutions: Optional[dict[str, Any]] = None,
         class_name: Optional[str] = None,
         class_doc: Optional[str] = None,
+        validate: bool = True,
     ) -> str:
         """Generate a text string from the data.
         Args:
             data: A dictionary of field values.
             substitutions: A dictionary of substitutions to apply to the template string.
+            validate: Validate the data. With False the instance is built with `model_construct`.
         Returns:
             The generated text string.
         """
         model_instance = self.get_instance(
-            data, substitutions=substitutions, class_name=class_name, class_doc=class_doc
+            data,
+            substitutions=substitutions,
+            class_name=class_name,
+            class_doc=class_doc,
+            validate=validate,
         )
         return self.get_text_from_instance(model_instance, data=data, substitutions=substitutions)
+
+    def get_text_from_dict(
+        self,
+        data: dict[str, Any],
+        substitutions: Optional[dict[str, Any]] = None,
+    ) -> str:
+        """Generate a text string straight from trusted data, without a model or an instance.
+        Field values are rendered as given (no coercion or defaults), so only use this
+        for data that is already known to match the template's types.
+        Args:
+            data: A dictionary of field values.
+            substitutions: A dictionary of substitutions to apply to the template string.
+        Returns:
+            The generated text string.
+        """
+        if substitutions is None:
+            substitutions = self.substitutions
+        with span("render", self.class_name) as s:
+            text = self.compiled.render_dict(
+                data,
+                substitutions=substitutions,
+                data=data,
+                allow_unknown=bool(self.delayed_substitution),
+            )
+            s.set(size=len(text))
+        return text
+
+    def get_texts(
+        self,
+        rows: Iterable[dict[str, Any]],
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+        errors: Optional[list[tuple[int, ValidationError]]] = None,
+        lazy: bool = False,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        validate: bool = True,
+        sample_every: Optional[int] = None,
+    ) -> Union[list[Optional[str]], Iterator[Optional[str]]]:
+        """Generate text strings for many rows of data.
+        The model is resolved once and rows are validated in batches of `batch_size`.
+        Rows that fail validation produce None instead of aborting the batch.
+        Args:
+            rows: An iterable of dictionaries of field values.
+            substitutions: A dictionary of substitutions to apply to the template string.
+            errors: If given, `(row_index, ValidationError)` pairs are appended for failed rows.
+            lazy: Return a generator instead of a list.
+            batch_size: Number of rows validated together.
+            validate: With False, rows are trusted and rendered straight from the dicts
+                like `get_text_from_dict`.
+            sample_every: Debugging aid for `validate=False`: still validate every n-th row
+                (the first row, then every `sample_every` rows) and treat failures as above.
+        Returns:
+            The generated text strings, in the same order as `rows`.
+        """
+        if sample_every is not None and sample_every < 1:
+            raise ValueError(f"sample_every must be >= 1, got {sample_every}")
+        if validate:
+            texts = self._iter_texts(
+                rows,
+                substitutions=substitutions,
+                class_name=class_name,
+                class_doc=class_doc,
+                errors=errors,
+                batch_size=batch_size,
+            )
+        else:
+            texts = self._iter_trusted_texts(
+                rows,
+                substitutions=substitutions,
+                class_name=class_name,
+                class_doc=class_doc,
+                errors=errors,
+                sample_every=sample_every,
+            )
+        return texts if lazy else list(texts)
+
+    def _iter_trusted_texts(
+        self,
+        rows: Iterable[dict[str, Any]],
+        substitutions: Optional[dict[str, Any]],
+        class_name: Optional[str],
+        class_doc: Optional[str],
+        errors: Optional[list[tuple[int, ValidationError]]],
+        sample_every: Optional[int],
+    ) -> Iterator[Optional[str]]:
+        ## The model is only needed for sampled validation
+        DynamicModel = (
+            self.get_model(substitutions=substitutions, class_name=class_name, class_doc=class_doc)
+            if sample_every
+            else None
+        )
+        if substitutions is None:
+            substitutions = self.substitutions
+        render_dict = self.compiled.render_dict
+        allow_unknown = bool(self.delayed_substitution)
+
+        for i, data in enumerate(rows):
+            if DynamicModel is not None and i % sample_every == 0:  # type: ignore
+                try:
+                    DynamicModel.model_validate(data)
+                except ValidationError as e:
+                    if errors is not None:
+                        errors.append((i, e))
+                    yield None
+                    continue
+            yield render_dict(data, substitutions=substitutions, data=data, allow_unknown=allow_unknown)
+
+    def _iter_texts(
+        self,
+        rows: Iterable[dict[str, Any]],
+        substitutions: Optional[dict[str, Any]],
+        class_name: Optional[str],
+        class_doc: Optional[str],
+        errors: Optional[list[tuple[int, ValidationError]]],
+        batch_size: int,
+    ) -> Iterator[Optional[str]]:
+        DynamicModel = self.get_model(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        if substitutions is None:
+            substitutions = self.substitutions
+        render = self.compiled.render
+        allow_unknown = bool(self.delayed_substitution)
+
+        name = DynamicModel.__name__
+
+        offset = 0
+        it = iter(rows)
+        while batch := list(islice(it, batch_size)):
+            with span("validate", name) as s:
+                instances = self._validate_batch(DynamicModel, batch, offset, errors)
+                s.set(size=len(batch))
+            with span("render", name) as s:
+                texts = [
+                    None
+                    if instance is None
+                    else render(
+                        instance, substitutions=substitutions, data=data, allow_unknown=allow_unknown
+                    )
+                    for data, instance in zip(batch, instances)
+                ]
+                if instrumentation_enabled():
+                    s.set(size=sum(len(text) for text in texts if text is not None))
+            yield from texts
+            offset += len(batch)
+
+    @staticmethod
+    def _validate_batch(
+        model: type[BaseModel],
+        batch: list[dict[str, Any]],
+        offset: int,
+        errors: Optional[list[tuple[int, ValidationError]]],
+    ) -> list[Optional[BaseModel]]:
+        adapter = _list_adapter(model)
+        try:
+            return adapter.validate_python(batch)
+        except ValidationError:
+            pass
+        ## Fall back to per-row validation so one bad row doesn't sink the batch
+        instances: list[Optional[BaseModel]] = []
+        for i, data in enumerate(batch):
+            try:
+                instances.append(model.model_validate(data))
+            except ValidationError as e:
+                instances.append(None)
+                if errors is not None:
+                    errors.append((offset + i, e))
+        return instances
+
+    def get_text_from_json(
+        self,
+        json_data: Union[str, bytes, bytearray],
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+    ) -> str:
+        """Generate a text string from a raw JSON object, like `get_text(json.loads(json_data))`.
+        The JSON is parsed and validated in one step by the model's `model_validate_json`,
+        without an intermediate dict. `{key}` slots not covered by substitutions fall
+        back to the record's values, including keys that aren't fields.
+        Args:
+            json_data: A JSON object with the field values.
+            substitutions: A dictionary of substitutions to apply to the template string.
+        Returns:
+            The generated text string.
+        """
+        DynamicModel = self.get_model(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        with span("validate", DynamicModel.__name__):
+            model_instance = self._json_model(DynamicModel).model_validate_json(json_data)
+        return self.get_text_from_instance(
+            model_instance, data=_json_data(model_instance), substitutions=substitutions
+        )
+
+    def get_texts_from_jsonl(
+        self,
+        source: JsonLines,
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+        errors: Optional[list[tuple[int, ValidationError]]] = None,
+        lazy: bool = False,
+    ) -> Union[list[Optional[str]], Iterator[Optional[str]]]:
+        """Generate text strings for JSON lines, one record per line.
+        Each line is validated straight from its bytes with `model_validate_json`.
+        Blank lines are skipped; lines that fail validation produce None.
+        Args:
+            source: JSONL as str or bytes, an `mmap.mmap`, a file or an iterable of lines.
+                Buffers and mmaps are scanned in place, so large files stream without
+                being read into memory.
+            substitutions: A dictionary of substitutions to apply to the template string.
+            errors: If given, `(record_index, ValidationError)` pairs are appended for failed lines.
+            lazy: Return a generator instead of a list.
+        Returns:
+            The generated text strings, in the same order as the lines.
+        """
+        texts = self._iter_json_texts(source, substitutions, class_name, class_doc, errors)
+        return texts if lazy else list(texts)
+
+    def _iter_json_texts(
+        self,
+        source: JsonLines,
+        substitutions: Optional[dict[str, Any]],
+        class_name: Optional[str],
+        class_doc: Optional[str],
+        errors: Optional[list[tuple[int, ValidationError]]],
+    ) -> Iterator[Optional[str]]:
+        DynamicModel = self.get_model(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        if substitutions is None:
+            substitutions = self.substitutions
+        validate_json = self._json_model(DynamicModel).model_validate_json
+        render = self.compiled.render
+        allow_unknown = bool(self.delayed_substitution)
+
+        for i, line in enumerate(_iter_json_lines(source)):
+            try:
+                instance = validate_json(line)
+            except ValidationError as e:
+                if errors is not None:
+                    errors.append((i, e))
+                yield None
+                continue
+            yield render(
+                instance,
+                substitutions=substitutions,
+                data=_json_data(instance),
+                allow_unknown=allow_unknown,
+            )
+
+    def _json_model(self, model: type[BaseModel]) -> type[BaseModel]:
+        """The model JSON records are validated with. Templates with `{key}` slots keep
+        the records' extra keys for them, as `get_text` does with its dict."""
+        return _extra_model(model) if self.compiled.sub_keys else model
+
+    def parse_text(
+        self,
+        text: str,
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+    ) -> Optional[BaseModel]:
+        """Recover the model instance from text rendered by this template, without an LLM.
+        The inverse of `get_text_from_instance`: the text is matched against a regex built
+        from the template's literal segments and field slots, and the captured values are
+        validated (and coerced back to their types) by the model. Where the text is
+        ambiguous, a field followed by literal text ends at the first occurrence of that
+        text (so a value containing it doesn't round-trip), and of two fields with
+        nothing between them the first takes the shortest value that lets the rest match.
+        Args:
+            text: Text produced by this template.
+            substitutions: The substitutions the text was rendered with.
+        Returns:
+            The model instance, or None if the text doesn't match the template or its
+            values don't validate.
+        """
+        DynamicModel = self.get_model(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        pattern, groups = self.text_parser(substitutions)
+        match = pattern.fullmatch(text)
+        if match is None:
+            return None
+        return _validate_text_values(
+            DynamicModel, {name: match.group(group) for group, name in groups}
+        )
+
+    def text_parser(
+        self, substitutions: Optional[dict[str, Any]] = None
+    ) -> tuple[re.Pattern, tuple[tuple[str, str], ...]]:
+        """The (cached) compiled regex used by `parse_text` and its `(group, field)` pairs."""
+        if substitutions is None:
+            substitutions = self.substitutions
+        items = tuple(sorted((substitutions or {}).items()))
+        try:
+            return _get_text_parser(self.template, self.field_regex, items)
+        except TypeError:
+            ## Unhashable substitution values, build it uncached
+            return _get_text_parser.__wrapped__(self.template, self.field_regex, items)
+
+    def iter_text(
+        self,
+        instance_or_data: Union[BaseModel, dict[str, Any]],
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Yield the generated text segment by segment instead of building one string.
+        Args:
+            instance_or_data: A model instance, or a dictionary of field values to validate.
+            substitutions: A dictionary of substitutions to apply to the template string.
+        Returns:
+            An iterator of text chunks; joined, they equal `get_text`/`get_text_from_instance`.
+        """
+        if isinstance(instance_or_data, BaseModel):
+            model_instance, data = instance_or_data, None
+        else:
+            data = instance_or_data
+            model_instance = self.get_instance(
+                data, substitutions=substitutions, class_name=class_name, class_doc=class_doc
+            )
+        if substitutions is None:
+            substitutions = self.substitutions
+        return self.compiled.iter_render(
+            model_instance,
+            substitutions=substitutions,
+            data=data,
+            allow_unknown=bool(self.delayed_substitution),
+        )
+
+    def render_to(
+        self,
+        writer: IO[Any],
+        instance_or_data: Union[BaseModel, dict[str, Any]],
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+        encoding: str = "utf-8",
+    ) -> None:
+        """Write the generated text to a file-like object without materializing it.
+        Args:
+            writer: A text or binary file-like object (e.g. a file, `io.BufferedWriter`
+                or `socket.makefile("wb")`). Text is encoded with `encoding` for binary writers.
+            instance_or_data: A model instance, or a dictionary of field values to validate.
+            substitutions: A dictionary of substitutions to apply to the template string.
+        """
+        write = _get_write(writer, encoding)
+        for chunk in self.iter_text(
+            instance_or_data, substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        ):
+            write(chunk)
+
+    def render_many_to(
+        self,
+        writer: IO[Any],
+        rows: Iterable[dict[str, Any]],
+        separator: str = "\n",
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+        errors: Optional[list[tuple[int, ValidationError]]] = None,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        encoding: str = "utf-8",
+    ) -> int:
+        """Stream many rows to a file-like object, each followed by `separator`.
+        Rows are validated in batches like `get_texts`; rows that fail validation
+        are skipped and reported through `errors`. Memory use is bounded by `batch_size`.
+        Returns:
+            The number of rows written.
+        """
+        DynamicModel = self.get_model(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        if substitutions is None:
+            substitutions = self.substitutions
+        write = _get_write(writer, encoding)
+        iter_render = self.compiled.iter_render
+        allow_unknown = bool(self.delayed_substitution)
+
+        written = 0
+        offset = 0
+        it = iter(rows)
+        while batch := list(islice(it, batch_size)):
+            instances = self._validate_batch(DynamicModel, batch, offset, errors)
+            for data, instance in zip(batch, instances):
+                if instance is None:
+                    continue
+                for chunk in iter_render(instance, substitutions, data, allow_unknown):
+                    write(chunk)
+                write(separator)
+                written += 1
+            offset += len(batch)
+        return written
+
+    def render_parallel(
+        self,
+        rows: Iterable[dict[str, Any]],
+        workers: Optional[int] = None,
+        chunksize: int = 1000,
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+        output_dir: Optional[Union[str, Path]] = None,
+        separator: str = "\n",
+    ) -> Union[Iterator[Optional[str]], list[Path]]:
+        """Render rows on a process pool.
+        Each worker rebuilds the template from `to_spec` and its model once, then
+        renders chunks of `chunksize` rows like `get_texts`.
+        Args:
+            rows: An iterable of dictionaries of field values, consumed lazily.
+            workers: Number of worker processes. Defaults to the number of CPUs.
+            chunksize: Number of rows sent to a worker at a time.
+            substitutions: A dictionary of substitutions to apply to the template string.
+            output_dir: If given, each chunk is written by its worker to `part-NNNNN.txt`
+                in this directory, one row per `separator`, instead of being sent back.
+        Returns:
+            An iterator of texts in input order (None for rows that fail validation),
+            or the list of shard paths in input order when `output_dir` is given.
+        """
+        from .parallel import render_parallel
+
+        return render_parallel(
+            self,
+            rows,
+            workers=workers,
+            chunksize=chunksize,
+            substitutions=substitutions,
+            class_name=class_name,
+            class_doc=class_doc,
+            output_dir=output_dir,
+            separator=separator,
+        )
+
+    def to_columns(
+        self,
+        rows: Iterable[dict[str, Any]],
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+        errors: Optional[list[tuple[int, ValidationError]]] = None,
+        batch_size: int = 1024,
+    ) -> dict[str, "Column"]:
+        """Validate rows into one column per field instead of one model instance per row.
+        Rows are validated and coerced in batches of `batch_size` against the field types
+        of the cached model; `int` and `float` fields are stored in `array.array` buffers
+        (an int column becomes a list once a value doesn't fit 64 bits) and other fields
+        in lists. Rows that fail validation are left out.
+        Args:
+            rows: An iterable of dictionaries of field values, consumed lazily.
+            substitutions: A dictionary of substitutions to apply to the template string.
+            errors: If given, `(row_index, ValidationError)` pairs are appended for skipped rows.
+            batch_size: Number of rows validated at a time.
+        Returns:
+            A dict mapping field names to columns of equal length.
+        """
+        from .columnar import validate_columns
+
+        DynamicModel = self.get_model(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        with span("validate_columns", DynamicModel.__name__):
+            return validate_columns(DynamicModel, rows, errors=errors, batch_size=batch_size)
+
+    def to_columns_from_jsonl(
+        self,
+        source: JsonLines,
+        substitutions: Optional[dict[str, Any]] = None,
+        class_name: Optional[str] = None,
+        class_doc: Optional[str] = None,
+        errors: Optional[list[tuple[int, ValidationError]]] = None,
+        batch_size: int = 1024,
+    ) -> dict[str, "Column"]:
+        """Like `to_columns`, but each record is validated straight from a JSON line.
+        Args:
+            source: JSONL as str or bytes, an `mmap.mmap`, a file or an iterable of lines.
+            errors: If given, `(record_index, ValidationError)` pairs are appended for skipped lines.
+        Returns:
+            A dict mapping field names to columns of equal length.
+        """
+        from .columnar import validate_json_columns
+
+        DynamicModel = self.get_model(
+            substitutions=substitutions, class_name=class_name, class_doc=class_doc
+        )
+        with span("validate_columns", DynamicModel.__name__):
+            return validate_json_columns(DynamicModel, source, errors=errors, batch_size=batch_size)
+
+    def render_columns(
+        self,
+        columns: Mapping[str, "Column"],
+        substitutions: Optional[dict[str, Any]] = None,
+    ) -> list[str]:
+        """Render the text of every row of `columns`, as returned by `to_columns`.
+        The template is walked once and each field column is converted to strings
+        in one pass; the values are rendered as given, without validation.
+        Args:
+            columns: A mapping of field names to equal-length columns.
+            substitutions: A dictionary of substitutions to apply to the template string.
+        Returns:
+            The generated text strings, one per row.
+        """
+        from .columnar import render_columns
+
+        return render_columns(self, columns, substitutions)
@@ -0,0 +1,270 @@
+"""Parser for the type part of `<#name|type|description#>` field specs.
+
+Supports the plain names in `type_mapping` plus parameterized types such as
+`list[int]`, `dict[str, float]`, `Optional[float]`, `int | None`,
+`Literal['a', 'b']` and `tuple[int, ...]`. Extra names (for instance other
+templates, used as nested models) are looked up in an optional namespace.
+Anything that does not parse is treated as `str`, as before.
+
+Two part specs (`<#name|x#>`) are ambiguous, `x` may be a type or a description.
+There only expressions built from the original names in `LEGACY_TYPE_NAMES` (and
+namespace names) count as types, so e.g. `<#when|time#>` is still a `str` field.
+"""
+
+import datetime
+import decimal
+import re
+import threading
+import uuid
+from contextlib import contextmanager
+from functools import lru_cache, reduce
+from typing import Any, Iterator, Literal, Mapping, Optional, Union
+
+# Mapping of string data type to actual Python type
+type_mapping: dict[str, Any] = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "list": list,
+    "dict": dict,
+    "tuple": tuple,
+    "set": set,
+    "bytes": bytes,
+    "date": datetime.date,
+    "datetime": datetime.datetime,
+    "time": datetime.time,
+    "timedelta": datetime.timedelta,
+    "Decimal": decimal.Decimal,
+    "UUID": uuid.UUID,
+    "Any": Any,
+    "None": type(None),
+}
+
+## The names a two part spec resolved to before parameterized types were supported
+LEGACY_TYPE_NAMES = frozenset(["str", "int", "float", "bool", "list", "dict"])
+
+## Aliases accepted for typing-style names
+_aliases = {"List": "list", "Dict": "dict", "Tuple": "tuple", "Set": "set"}
+
+_TOKEN_RE = re.compile(
+    r"\s*(?:(?P<str>'[^']*'|\"[^\"]*\")|(?P<num>-?\d+(?:\.\d+)?)|(?P<ellipsis>\.\.\.)"
+    r"|(?P<name>[A-Za-z_][\w.]*)|(?P<punct>[\[\],|]))"
+)
+
+
+class TypeSyntaxError(ValueError):
+    pass
+
+
+class TypeCycleError(ValueError):
+    """A namespace type (e.g. a registry template) refers back to itself."""
+
+
+## Parsed type expressions are nested tuples:
+##   ("name", name) | ("sub", name, args) | ("lit", value) | ("union", members) | ("ellipsis",)
+Node = tuple
+
+
+def _tokenize(type_str: str) -> list[tuple[str, str]]:
+    tokens = []
+    pos = 0
+    type_str = type_str.strip()
+    while pos < len(type_str):
+        match = _TOKEN_RE.match(type_str, pos)
+        if match is None or match.end() == pos:
+            raise TypeSyntaxError(f"Unexpected character at {pos} in {type_str!r}")
+        kind = match.lastgroup
+        tokens.append((kind, match.group(kind)))  # type: ignore
+        pos = match.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, type_str: str):
+        self.tokens = _tokenize(type_str)
+        self.pos = 0
+
+    def peek(self) -> Optional[tuple[str, str]]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self) -> tuple[str, str]:
+        token = self.peek()
+        if token is None:
+            raise TypeSyntaxError("Unexpected end of type")
+        self.pos += 1
+        return token
+
+    def expect(self, value: str) -> None:
+        kind, text = self.next()
+        if text != value:
+            raise TypeSyntaxError(f"Expected {value!r}, got {text!r}")
+
+    def parse(self) -> Node:
+        node = self.union()
+        if self.peek() is not None:
+            raise TypeSyntaxError(f"Unexpected {self.peek()[1]!r}")  # type: ignore
+        return node
+
+    def union(self) -> Node:
+        members = [self.term()]
+        while self.peek() == ("punct", "|"):
+            self.next()
+            members.append(self.term())
+        return members[0] if len(members) == 1 else ("union", tuple(members))
+
+    def term(self) -> Node:
+        kind, text = self.next()
+        if kind == "str":
+            return ("lit", text[1:-1])
+        if kind == "num":
+            return ("lit", float(text) if "." in text else int(text))
+        if kind == "ellipsis":
+            return ("ellipsis",)
+        if kind != "name":
+            raise TypeSyntaxError(f"Unexpected {text!r}")
+        if text in ("True", "False"):
+            return ("lit", text == "True")
+        if self.peek() != ("punct", "["):
+            return ("name", text)
+        self.next()
+        args = [self.union()]
+        while self.peek() == ("punct", ","):
+            self.next()
+            args.append(self.union())
+        self.expect("]")
+        return ("sub", text, tuple(args))
+
+
+@lru_cache(maxsize=1024)
+def parse_type_expr(type_str: str) -> Node:
+    """Parse a type string into a tree of tuples. Raises TypeSyntaxError."""
+    return _Parser(type_str).parse()
+
+
+def _names(node: Node) -> Iterator[str]:
+    kind = node[0]
+    if kind == "name":
+        yield node[1]
+    elif kind == "sub":
+        yield node[1]
+        for arg in node[2]:
+            yield from _names(arg)
+    elif kind == "union":
+        for member in node[1]:
+            yield from _names(member)
+
+
+@lru_cache(maxsize=1024)
+def referenced_names(type_str: Optional[str]) -> frozenset[str]:
+    """The type names used in a type string, or an empty set if it doesn't parse."""
+    if not type_str:
+        return frozenset()
+    try:
+        return frozenset(_names(parse_type_expr(type_str)))
+    except TypeSyntaxError:
+        return frozenset()
+
+
+## Namespace entries being resolved (or fingerprinted) on this thread, to detect cycles
+_resolving = threading.local()
+
+
+@contextmanager
+def resolving(name: str, value: Any) -> Iterator[None]:
+    """Mark the namespace entry `value` as being followed for the duration of the block.
+    Raises:
+        TypeCycleError: `value` is already being followed, i.e. it refers back to itself.
+    """
+    stack: list[tuple[str, Any]] = _resolving.__dict__.setdefault("stack", [])
+    if any(entry is value for _, entry in stack):
+        path = " -> ".join([n for n, _ in stack] + [name])
+        raise TypeCycleError(f"Recursive template types are not supported: {path}")
+    stack.append((name, value))
+    try:
+        yield
+    finally:
+        stack.pop()
+
+
+def _lookup(name: str, namespace: Optional[Mapping[str, Any]]) -> Any:
+    if namespace is not None and name in namespace:
+        value = namespace[name]
+        ## Templates (or anything else with get_model) become nested models
+        get_model = getattr(value, "get_model", None)
+        if not callable(get_model):
+            return value
+        with resolving(name, value):
+            return get_model()
+    name = _aliases.get(name, name)
+    if name in type_mapping:
+        return type_mapping[name]
+    raise TypeSyntaxError(f"Unknown type {name!r}")
+
+
+def _resolve(node: Node, namespace: Optional[Mapping[str, Any]]) -> Any:
+    kind = node[0]
+    if kind == "name":
+        return _lookup(node[1], namespace)
+    if kind == "union":
+        return reduce(lambda a, b: Union[a, b], (_resolve(m, namespace) for m in node[1]))
+    if kind == "sub":
+        name, args = node[1], node[2]
+        if name == "Literal":
+            if any(arg[0] != "lit" for arg in args):
+                raise TypeSyntaxError("Literal only accepts literal values")
+            return Literal[tuple(arg[1] for arg in args)]  # type: ignore
+        resolved = tuple(_resolve(arg, namespace) for arg in args)
+        if name == "Optional":
+            if len(resolved) != 1:
+                raise TypeSyntaxError("Optional takes a single type")
+            return Optional[resolved[0]]
+        if name == "Union":
+            return Union[resolved]  # type: ignore
+        origin = _lookup(name, namespace)
+        try:
+            return origin[resolved if len(resolved) > 1 else resolved[0]]
+        except TypeError as e:
+            raise TypeSyntaxError(str(e)) from e
+    if kind == "ellipsis":
+        return ...
+    raise TypeSyntaxError(f"Unexpected {node!r}")
+
+
+@lru_cache(maxsize=1024)
+def _resolve_builtin(type_str: str) -> Any:
+    try:
+        return _resolve(parse_type_expr(type_str), None)
+    except TypeSyntaxError:
+        return str
+
+
+def resolve_type(
+    type_str: Optional[str],
+    namespace: Optional[Mapping[str, Any]] = None,
+    extended: bool = True,
+) -> Any:
+    """Return the Python type for a field spec type string.
+    Args:
+        type_str: The type part of a field spec, e.g. "list[int]".
+        namespace: Extra names, e.g. other templates to use as nested models.
+        extended: False for two part specs, which only accept `LEGACY_TYPE_NAMES`
+            and namespace names.
+    Returns:
+        The resolved type, or `str` if the type string doesn't parse or names an unknown type.
+    Raises:
+        TypeCycleError: A namespace template refers back to itself.
+    """
+    if not type_str:
+        return str
+    if not extended:
+        allowed = LEGACY_TYPE_NAMES.union(namespace or ())
+        names = referenced_names(type_str)
+        if not names or not names <= allowed:
+            return str
+    if not namespace:
+        return _resolve_builtin(type_str)
+    try:
+        return _resolve(parse_type_expr(type_str), namespace)
+    except TypeSyntaxError:
+        return str
@@ -0,0 +1,61 @@
+import pytest
+
+from template_models.compiled_template import (
+    FieldSlot,
+    FieldSpec,
+    SubSlot,
+    compile_template,
+)
+from template_models.template_model import DEFAULT_FIELD_REGEX, TemplateModel
+
+
+def test_field_specs():
+    compiled = compile_template(
+        "<#name#> <#age|int#> <#bio|A short bio#> <#score|float|The score#>", DEFAULT_FIELD_REGEX
+    )
+    assert compiled.fields == (
+        FieldSpec("name"),
+        FieldSpec("age", "int", "int", typed=False),
+        FieldSpec("bio", "A short bio", "A short bio", typed=False),
+        FieldSpec("score", "float", "The score"),
+    )
+
+
+def test_segments():
+    compiled = compile_template("Hi {who}, <#name|str|Name#>!", DEFAULT_FIELD_REGEX)
+    assert compiled.segments[0] == "Hi "
+    assert isinstance(compiled.segments[1], SubSlot)
+    assert compiled.segments[2:] == (", ", FieldSlot("name"), "!")
+    assert compiled.sub_keys == {"who"}
+
+
+def test_compile_is_cached():
+    template = "Name:<#name#>"
+    assert compile_template(template, DEFAULT_FIELD_REGEX) is compile_template(
+        template, DEFAULT_FIELD_REGEX
+    )
+
+
+def test_format_spec_and_conversion():
+    text_generator = TemplateModel("[{n:>3}] {s!r} <#name#>")
+    assert text_generator.get_text({"name": "Jay"}, substitutions={"n": 7, "s": "x"}) == "[  7] 'x' Jay"
+
+
+def test_braces_in_values_are_not_reformatted():
+    text_generator = TemplateModel("Data:<#data|dict|Some data#> Name:<#name#>")
+    assert (
+        text_generator.get_text({"data": {"a": 1}, "name": "{x}"})
+        == "Data:{'a': 1} Name:{x}"
+    )
+
+
+def test_missing_substitution_raises():
+    text_generator = TemplateModel("{missing} <#name#>")
+    with pytest.raises(KeyError):
+        text_generator.get_text({"name": "Jay"})
+
+
+def test_no_substitutions_keeps_literal_text():
+    text_generator = TemplateModel("{{literal}} {key} <#name#>", delayed_substitution=True)
+    instance = text_generator.get_instance({"name": "Jay"})
+    assert text_generator.get_text_from_instance(instance) == "{{literal}} {key} Jay"
@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+LLM_MODULES = ("openai", "anthropic", "instructor", "qrev_instructor")
+
+
+def run(code: str) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+def test_import_does_not_load_llm_stack():
+    loaded = run(
+        "import sys, template_models, template_models.llm_template_model;"
+        f"print(','.join(m for m in {LLM_MODULES!r} if m in sys.modules))"
+    )
+    assert loaded == ""
+
+
+def test_llm_template_model_is_lazy():
+    from template_models import LLMTemplateModel
+    from template_models.llm_template_model import LLMTemplateModel as Direct
+
+    assert LLMTemplateModel is Direct
+    assert run("import template_models; print(template_models.LLMTemplateModel.__name__)") == (
+        "LLMTemplateModel"
+    )
@@ -0,0 +1,74 @@
+from types import SimpleNamespace
+
+import pytest
+
+from template_models import instrumentation
+from template_models.instrumentation import NULL_SPAN, StatsAggregator
+from template_models.template_model import TemplateModel
+
+
+@pytest.fixture
+def stats():
+    stats = StatsAggregator()
+    instrumentation.add_hook(stats)
+    yield stats
+    instrumentation.remove_hook(stats)
+
+
+def test_disabled_span_is_noop():
+    assert not instrumentation.enabled()
+    assert instrumentation.span("render") is NULL_SPAN
+
+
+def test_get_text_stages(stats):
+    TemplateModel.clear_cache()
+    text_generator = TemplateModel("Name:<#name#> Age:<#age|int#>", class_name="Person")
+    text_generator.get_text({"name": "Jay", "age": 30})
+    text_generator.get_text({"name": "Kay", "age": 31})
+
+    report = stats.report()["Person"]
+    assert set(report) == {"format", "parse", "create_model", "validate", "render"}
+    assert report["parse"]["count"] == 1
+    assert report["create_model"]["cache_hits"] == 1
+    assert report["create_model"]["cache_misses"] == 1
+    assert report["render"]["count"] == 2
+    assert report["render"]["size"] == len("Name:Jay Age:30") * 2
+    assert 0 <= report["render"]["p50"] <= report["render"]["p99"]
+
+
+def test_get_texts_stages(stats):
+    text_generator = TemplateModel("Name:<#name#>", class_name="Batch")
+    text_generator.get_texts([{"name": "Jay"}, {"name": "Kay"}])
+    report = stats.report()["Batch"]
+    assert report["validate"]["size"] == 2
+    assert report["render"]["size"] == len("Name:Jay") * 2
+
+
+def test_llm_usage():
+    from template_models.llm_template_model import get_usage
+
+    response = SimpleNamespace(
+        _raw_response=SimpleNamespace(usage=SimpleNamespace(prompt_tokens=12, completion_tokens=3))
+    )
+    assert get_usage(response) == {"prompt_tokens": 12, "completion_tokens": 3}
+    assert get_usage(object()) == {}
+
+
+def test_percentiles():
+    stats = StatsAggregator()
+    for i in range(1, 101):
+        stats(instrumentation.StageEvent("render", "A", duration=i))
+    report = stats.report()["A"]["render"]
+    assert (report["p50"], report["p95"], report["p99"]) == (50, 95, 99)
+    stats.clear()
+    assert stats.report() == {}
+
+
+def test_durations_are_bounded():
+    stats = StatsAggregator(max_samples=100)
+    for i in range(10_000):
+        stats(instrumentation.StageEvent("render", "A", duration=i % 100, size=1))
+    report = stats.report()["A"]["render"]
+    assert report["count"] == report["size"] == 10_000
+    assert len(stats._durations[("A", "render")]) == 100
+    assert 0 <= report["p50"] <= report["p99"] < 100
@@ -1,10 +1,21 @@
+import asyncio
+import json
 import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
 
 import pytest
 from pi_conf import load_config
 from pydantic import BaseModel
 
 from template_models import LLMTemplateModel
+from template_models.client_pool import ClientPool
+from template_models.llm_template_model import get_prompt_model
+from template_models.response_cache import InMemoryResponseCache, SQLiteResponseCache
+from template_models.scheduler import RetryPolicy, Scheduler
 
 """Example .config.toml file
 [openai]
@@ -15,7 +26,10 @@ api_key = "<apikey>"
 api_key = "<apikey>"
 """
 
-load_config().to_env()  ## put .config.toml into environment variables
+try:
+    load_config().to_env()  ## put .config.toml into environment variables
+except FileNotFoundError:
+    pass  ## No .config.toml; the tests needing API keys are skipped
 
 
 def skip_if_no_api_key():
@@ -122,5 +136,451 @@ def test_doc_name_on_generate_model():
     assert model.__name__ == "MyModel"
 
 
+class StubClient:
+    """Instructor stand-in that parses "name,age" queries without a network call."""
+
+    def __init__(self):
+        self.calls = 0
+        self.requests = []
+        self.options = []
+        self.chat = SimpleNamespace(
+            completions=SimpleNamespace(create=self.create, create_partial=self.create_partial)
+        )
+
+    def create(self, model, messages, response_model, **kwargs):
+        self.calls += 1
+        self.requests.append((messages, response_model))
+        self.options.append(kwargs)
+        content = messages[-1]["content"]
+        if "records" in response_model.model_fields:
+            records = []
+            for index, query in re.findall(r'<input index="(\d+)">\n(.*?)\n</input>', content):
+                if query == "skip":
+                    continue
+                name, age = query.split(",")
+                records.append({"index": index, "record": {"name": name, "age": age}})
+            return response_model(records=records)
+        if content == "skip":
+            content = "Skipped,0"
+        name, age = content.split(",")
+        return response_model(name=name, age=age)
+
+    def create_partial(self, model, messages, response_model, **kwargs):
+        self.calls += 1
+        self.options.append(kwargs)
+        name, age = messages[-1]["content"].split(",")
+        yield response_model.model_construct(name=name[:1])
+        yield response_model.model_construct(name=name)
+        yield response_model.model_construct(name=name, age=int(age))
+
+
+class StubAsyncClient:
+    """Async instructor stand-in that parses "name,age" queries without a network call."""
+
+    def __init__(self):
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, model, messages, response_model, **kwargs):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            name, age = messages[-1]["content"].split(",")
+            return response_model(name=name, age=age)
+        finally:
+            self.in_flight -= 1
+
+
+def test_agenerate_instance(name_age_template):
+    text_generator = LLMTemplateModel(name_age_template)
+    instance = asyncio.run(text_generator.agenerate_instance("Jay,30", llm=StubAsyncClient()))
+    assert instance.name == "Jay"  # type: ignore
+    assert instance.age == 30  # type: ignore
+
+
+def test_agenerate_text(name_age_template):
+    text_generator = LLMTemplateModel(name_age_template)
+    text = asyncio.run(text_generator.agenerate_text("Jay,30", llm=StubAsyncClient()))
+    assert text == "Name:Jay Age:30"
+
+
+def test_agenerate_many(name_age_template):
+    client = StubAsyncClient()
+    text_generator = LLMTemplateModel(name_age_template)
+    queries = [f"P{i},{i}" for i in range(10)] + ["bad query"]
+    results = asyncio.run(text_generator.agenerate_many(queries, max_concurrency=3, llm=client))
+    assert [r.age for r in results[:10]] == list(range(10))  # type: ignore
+    assert isinstance(results[10], ValueError)
+    assert client.max_in_flight == 3
+
+
+def test_generate_instance_with_client(name_age_template):
+    text_generator = LLMTemplateModel(name_age_template)
+    assert text_generator.generate_text("Jay,30", llm=StubClient()) == "Name:Jay Age:30"
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_response_cache(name_age_template, tmp_path, backend):
+    if backend == "memory":
+        cache = InMemoryResponseCache()
+    else:
+        cache = SQLiteResponseCache(tmp_path / "responses.sqlite")
+    client = StubClient()
+    text_generator = LLMTemplateModel(
+        name_age_template, class_name="Person", response_cache=cache
+    )
+    first = text_generator.generate_instance("Jay,30", llm=client)
+    second = text_generator.generate_instance("Jay,30", llm=client)
+    assert client.calls == 1
+    assert second == first
+    assert type(second) is type(first)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    text_generator.generate_instance("Jay,30", llm=client, use_cache=False)
+    text_generator.generate_instance("Jay,30", llm=client, temperature=0.5)
+    assert client.calls == 3
+
+
+def test_response_cache_ttl():
+    cache = InMemoryResponseCache(ttl=-1)
+    cache.set("key", "value")
+    assert cache.get("key") is None
+    assert len(cache) == 0
+
+
+def test_response_cache_async(name_age_template):
+    cache = InMemoryResponseCache()
+    client = StubAsyncClient()
+    text_generator = LLMTemplateModel(name_age_template, response_cache=cache)
+
+    async def run():
+        await text_generator.agenerate_instance("Jay,30", llm=client)
+        return await text_generator.agenerate_instance("Jay,30", llm=client)
+
+    assert asyncio.run(run()).name == "Jay"  # type: ignore
+    assert client.calls == 1
+
+
+def test_generate_instances(name_age_template):
+    client = StubClient()
+    text_generator = LLMTemplateModel(name_age_template)
+    queries = [f"P{i},{i}" for i in range(7)]
+    instances = text_generator.generate_instances(queries, batch_size=3, llm=client)
+    assert [i.age for i in instances] == list(range(7))  # type: ignore
+    assert client.calls == 3
+
+
+def test_generate_instances_retries_missing(name_age_template):
+    client = StubClient()
+    text_generator = LLMTemplateModel(name_age_template)
+    instances = text_generator.generate_instances(["Jay,30", "skip", "Kay,31"], llm=client)
+    assert [i.name for i in instances] == ["Jay", "Skipped", "Kay"]  # type: ignore
+    assert client.calls == 2
+
+
+def test_generate_instances_token_budget(name_age_template):
+    client = StubClient()
+    text_generator = LLMTemplateModel(name_age_template)
+    queries = ["Jay," + "1" * 40] * 4
+    text_generator.generate_instances(queries, max_batch_tokens=25, llm=client)
+    assert client.calls == 2
+
+
+def test_stream_instance(name_age_template):
+    text_generator = LLMTemplateModel(name_age_template)
+    instances = list(text_generator.stream_instance("Jay,30", llm=StubClient()))
+    assert [getattr(i, "name", None) for i in instances] == ["J", "Jay", "Jay", "Jay"]
+    assert instances[-1] == text_generator.get_instance({"name": "Jay", "age": 30})
+
+
+def test_stream_text(name_age_template):
+    text_generator = LLMTemplateModel(name_age_template)
+    chunks = list(text_generator.stream_text("Jay,30", llm=StubClient()))
+    assert chunks == ["Name:", "Jay Age:", "30"]
+
+
+def test_stream_text_with_sub_fields(name_age_with_sub_fields):
+    subs = {"var1": "Value1"}
+    text_generator = LLMTemplateModel(name_age_with_sub_fields, substitutions=subs)
+    text = "".join(text_generator.stream_text("Jay,30", llm=StubClient()))
+    assert text == "Var1:Value1 Name:Jay Age:30"
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """Answers chat completions with a tool call parsed from a "name,age" query.
+    Entries put in `server.failures` are played first, one per request: "429"
+    answers with a rate limit error, "timeout" answers too late, "400" rejects the request.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, response, headers=()):
+        payload = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for key, value in headers:
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)  # type: ignore
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.server.models.append(body["model"])  # type: ignore
+        failure = self.server.failures.pop(0) if self.server.failures else None  # type: ignore
+        if failure == "timeout":
+            time.sleep(1)
+        elif failure in ("429", "400"):
+            error = {"error": {"message": "stub error", "type": "stub", "code": failure}}
+            self.send_json(int(failure), error, headers=[("Retry-After", "0")])
+            return
+        name, age = body["messages"][-1]["content"].split(",")
+        tool = body["tools"][0]["function"]["name"]
+        arguments = json.dumps({"name": name, "age": int(age)})
+        response = {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": 0,
+            "model": body["model"],
+            "choices": [
+                {
+                    "index": 0,
+                    "finish_reason": "stop",
+                    "message": {
+                        "role": "assistant",
+                        "content": None,
+                        "tool_calls": [
+                            {
+                                "id": "call_stub",
+                                "type": "function",
+                                "function": {"name": tool, "arguments": arguments},
+                            }
+                        ],
+                    },
+                }
+            ],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        }
+        self.send_json(200, response)
+
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    server.connections = set()  # type: ignore
+    server.models = []  # type: ignore
+    server.failures = []  # type: ignore
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def stub_pool(stub_server):
+    host, port = stub_server.server_address
+    pool = ClientPool(
+        timeout=5, client_params={"api_key": "test", "base_url": f"http://{host}:{port}/v1"}
+    )
+    yield pool
+    pool.close()
+
+
+def test_client_pool_reuses_connections(name_age_template, stub_server, stub_pool):
+    text_generator = LLMTemplateModel(name_age_template, client_pool=stub_pool)
+    other_generator = LLMTemplateModel(name_age_template, client_pool=stub_pool)
+    for i in range(5):
+        assert text_generator.generate_text(f"Jay,{i}") == f"Name:Jay Age:{i}"
+    assert other_generator.generate_text("Kay,1") == "Name:Kay Age:1"
+    assert len(stub_server.connections) == 1
+    assert len(stub_pool) == 1
+
+
+def test_client_pool_shares_provider_client(stub_pool):
+    client = stub_pool.get("gpt-4o-mini")
+    assert stub_pool.get("gpt-4o-mini") is client
+    assert stub_pool.get("gpt-4o") is not client
+    assert len(stub_pool._raw_clients) == 1
+
+
+def test_close_only_closes_own_pool(name_age_template, stub_pool, monkeypatch):
+    closed = []
+    monkeypatch.setattr(ClientPool, "close", lambda pool: closed.append(pool))
+    LLMTemplateModel(name_age_template).close()
+    assert closed == []
+    LLMTemplateModel(name_age_template, client_pool=stub_pool).close()
+    assert closed == [stub_pool]
+
+
+def test_client_pool_close_in_running_loop(stub_pool):
+    stub_pool.get("gpt-4o-mini", asynchronous=True)
+
+    async def close():
+        with pytest.raises(RuntimeError, match="aclose"):
+            stub_pool.close()
+        assert len(stub_pool) == 1
+        await stub_pool.aclose()
+
+    asyncio.run(close())
+    assert len(stub_pool) == 0
+
+
+def test_temperature_is_sent(name_age_template):
+    client = StubClient()
+    text_generator = LLMTemplateModel(name_age_template)
+    text_generator.generate_text("Jay,30", llm=client, temperature=0.7)  # type: ignore
+    list(text_generator.stream_text("Jay,30", llm=client, temperature=0.3))  # type: ignore
+    text_generator.generate_instances(
+        ["Jay,30", "Kay,31"], llm=client, temperature=0.5  # type: ignore
+    )
+    assert [options["temperature"] for options in client.options] == [0.7, 0.3, 0.5]
+
+
+def test_system_prompt_is_sent_first(name_age_template):
+    client = StubClient()
+    text_generator = LLMTemplateModel(name_age_template, system_prompt="Extract people.")
+    instance = text_generator.generate_instance("Jay,30", llm=client)
+    assert type(instance) is text_generator.get_model()
+    messages, _ = client.requests[-1]
+    assert messages == [
+        {"role": "system", "content": "Extract people."},
+        {"role": "user", "content": "Jay,30"},
+    ]
+    text_generator.generate_instances(["Jay,30", "Kay,31"], llm=client, use_cache=False)
+    messages, _ = client.requests[-1]
+    assert messages[0]["role"] == "system"
+    assert messages[0]["content"].startswith("Extract people.")
+    assert "Jay,30" in messages[-1]["content"]
+
+
+def test_generate_instance_with_known_fields(name_age_template):
+    client = StubClient()
+    text_generator = LLMTemplateModel(name_age_template)
+    instance = text_generator.generate_instance("Kay,30", llm=client, known={"name": "Jay"})
+    assert type(instance) is text_generator.get_model()
+    assert (instance.name, instance.age) == ("Jay", 30)  # type: ignore
+    _, response_model = client.requests[-1]
+    assert list(response_model.model_fields) == ["age"]
+
+    ## Invalid known values are asked for again
+    known = {"name": "Jay", "age": "old"}
+    instance = text_generator.generate_instance("Kay,31", llm=client, known=known)
+    assert (instance.name, instance.age) == ("Jay", 31)  # type: ignore
+    _, response_model = client.requests[-1]
+    assert list(response_model.model_fields) == ["age"]
+
+    ## Nothing left to ask for
+    known = {"name": "Jay", "age": 5}
+    instance = text_generator.generate_instance("Kay,31", llm=client, known=known)
+    assert instance.age == 5  # type: ignore
+    assert client.calls == 2
+
+
+def test_agenerate_instance_with_known_fields(name_age_template):
+    text_generator = LLMTemplateModel(name_age_template)
+    text = asyncio.run(
+        text_generator.agenerate_text("Kay,30", llm=StubAsyncClient(), known={"name": "Jay"})
+    )
+    assert text == "Name:Jay Age:30"
+
+
+def test_compact_schema():
+    text_generator = LLMTemplateModel(
+        "<#name|str|Name#> <#age|int#> <#kind|Literal['a', 'b']|The kind#> "
+        "<#score|Optional[float]|The score#>",
+        class_name="Person",
+    )
+    pymodel = text_generator.get_model()
+    schema = get_prompt_model(pymodel).model_json_schema()
+    assert schema["title"] == "Person"
+    assert schema["properties"] == {
+        "name": {"type": "string"},
+        "age": {"type": "integer"},
+        "kind": {"description": "The kind", "enum": ["a", "b"]},
+        "score": {"description": "The score", "type": ["number", "null"]},
+    }
+    ## The model used everywhere else keeps the full schema
+    assert pymodel.model_json_schema()["properties"]["name"]["title"] == "Name"
+    tokens = text_generator.estimate_prompt_tokens("Jay,30")
+    assert tokens["schema"] < tokens["full_schema"]
+
+
+def test_compact_schema_nested_models():
+    person = LLMTemplateModel("<#name|str|Name#>", class_name="Person", class_doc="A person")
+    book = LLMTemplateModel(
+        "<#author|person|A person#> <#editors|list[person]|Editors#>",
+        class_name="Book",
+        types={"person": person},
+    )
+    schema = get_prompt_model(book.get_model()).model_json_schema()
+    assert "title" not in schema["$defs"]["Person"]
+    assert schema["properties"]["author"] == {"$ref": "#/$defs/Person"}
+
+
+@pytest.fixture
+def no_retry_pool(stub_server):
+    ## Leave retries to the scheduler
+    host, port = stub_server.server_address
+    pool = ClientPool(
+        timeout=0.3,
+        client_params={"api_key": "test", "base_url": f"http://{host}:{port}/v1", "max_retries": 0},
+    )
+    yield pool
+    pool.close()
+
+
+@pytest.mark.parametrize("failures", [["429", "429"], ["timeout"]])
+def test_scheduler_retries(name_age_template, stub_server, no_retry_pool, failures):
+    stub_server.failures.extend(failures)
+    scheduler = Scheduler(retry=RetryPolicy(base_delay=0.01))
+    text_generator = LLMTemplateModel(
+        name_age_template, client_pool=no_retry_pool, scheduler=scheduler
+    )
+    assert text_generator.generate_text("Jay,30") == "Name:Jay Age:30"
+    assert len(stub_server.models) == len(failures) + 1
+
+
+def test_scheduler_falls_back_after_retries(name_age_template, stub_server, no_retry_pool):
+    stub_server.failures.extend(["429", "429"])
+    scheduler = Scheduler(
+        retry=RetryPolicy(max_retries=1, base_delay=0.01), fallbacks={"gpt-4o-mini": "gpt-4o"}
+    )
+    text_generator = LLMTemplateModel(
+        name_age_template, client_pool=no_retry_pool, scheduler=scheduler
+    )
+    assert text_generator.generate_text("Jay,30") == "Name:Jay Age:30"
+    assert stub_server.models == ["gpt-4o-mini", "gpt-4o-mini", "gpt-4o"]
+
+
+def test_scheduler_does_not_retry_bad_requests(name_age_template, stub_server, no_retry_pool):
+    stub_server.failures.append("400")
+    scheduler = Scheduler(retry=RetryPolicy(base_delay=0.01))
+    text_generator = LLMTemplateModel(
+        name_age_template, client_pool=no_retry_pool, scheduler=scheduler
+    )
+    with pytest.raises(Exception):
+        text_generator.generate_instance("Jay,30")
+    assert len(stub_server.models) == 1
+
+
+def test_scheduler_async(name_age_template):
+    client = StubAsyncClient()
+    text_generator = LLMTemplateModel(name_age_template, scheduler=Scheduler(max_concurrency=2))
+    results = asyncio.run(
+        text_generator.agenerate_many([f"P{i},{i}" for i in range(6)], llm=client)
+    )
+    assert [r.age for r in results] == list(range(6))  # type: ignore
+    assert client.max_in_flight == 2
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-k", "", "-W", "ignore:Module already imported:pytest.PytestWarning"])
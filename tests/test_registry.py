@@ -0,0 +1,110 @@
+import importlib
+import json
+
+import pytest
+
+from template_models import LLMTemplateModel, TemplateModel, TemplateRegistry
+from template_models.model_cache import DEFAULT_MODEL_CACHE_SIZE
+
+
+@pytest.fixture
+def specs():
+    return {
+        "person": {
+            "template": "Name:<#name|str|The name#> Age:<#age|int|The age#>",
+            "class_doc": "A person.",
+        },
+        "greeting": {
+            "template": "Hello {who}, <#name#>",
+            "substitutions": {"who": "world"},
+        },
+    }
+
+
+def test_lazy_build(specs):
+    registry = TemplateRegistry(specs)
+    assert len(registry) == 2
+    assert "person" in registry
+    assert registry._templates == {}
+    template = registry.get("person")
+    assert registry["person"] is template
+    assert registry.get_model("person").__name__ == "Person"
+    assert template.get_text({"name": "Jay", "age": 30}) == "Name:Jay Age:30"
+    assert list(registry._templates) == ["person"]
+
+
+def test_unknown_template(specs):
+    registry = TemplateRegistry(specs)
+    with pytest.raises(KeyError):
+        registry.get("missing")
+    with pytest.raises(ValueError):
+        registry.register("bad", {"descriptions": {}})
+
+
+def test_from_manifest_toml(tmp_path):
+    manifest = tmp_path / "templates.toml"
+    manifest.write_text(
+        '[templates.person]\ntemplate = "Name:<#name#>"\nclass_doc = "A person."\n'
+        '[templates.bot]\nkind = "llm"\ntemplate = "Answer:<#answer#>"\nmodel_name = "gpt-4o"\n'
+    )
+    registry = TemplateRegistry.from_manifest(manifest)
+    assert registry.get("person").get_text({"name": "Jay"}) == "Name:Jay"
+    bot = registry.get("bot")
+    assert isinstance(bot, LLMTemplateModel)
+    assert bot.model_name == "gpt-4o"
+
+
+def test_from_manifest_json(tmp_path, specs):
+    manifest = tmp_path / "templates.json"
+    manifest.write_text(json.dumps(specs))
+    registry = TemplateRegistry.from_manifest(manifest)
+    assert registry.get("greeting").get_text({"name": "Jay"}) == "Hello world, Jay"
+
+
+def test_from_directory(tmp_path):
+    (tmp_path / "welcome_email.txt").write_text("Welcome <#name#>!")
+    (tmp_path / "person.json").write_text(json.dumps({"template": "Name:<#name#>"}))
+    (tmp_path / "notes.md").write_text("ignored")
+    registry = TemplateRegistry.from_directory(tmp_path)
+    assert sorted(registry) == ["person", "welcome_email"]
+    assert registry.get_model("welcome_email").__name__ == "WelcomeEmail"
+
+
+def test_register_instance():
+    registry = TemplateRegistry()
+    template = TemplateModel("Name:<#name#>")
+    registry.register("person", template)
+    assert registry.get("person") is template
+
+
+def test_compile_and_load_module(tmp_path, monkeypatch, specs):
+    registry = TemplateRegistry(specs)
+    registry.compile(tmp_path / "compiled_templates.py")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    TemplateModel.clear_cache()
+    loaded = TemplateRegistry.from_module("compiled_templates")
+    model = loaded.get_model("person")
+    assert model.__module__ == "compiled_templates"
+    assert model.__doc__ == "A person."
+    assert model.model_json_schema() == registry.get_model("person").model_json_schema()
+    assert TemplateModel.cache_info().misses == 0
+    assert loaded.get("greeting").get_text({"name": "Jay"}) == "Hello world, Jay"
+
+
+def test_precompiled_models_survive_cache_eviction(tmp_path, monkeypatch):
+    n = DEFAULT_MODEL_CACHE_SIZE + 44
+    registry = TemplateRegistry(
+        {f"t{i}": {"template": f"T{i}:<#value|int|Value {i}#>"} for i in range(n)}
+    )
+    registry.compile(tmp_path / "many_templates.py")
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    TemplateModel.clear_cache()
+    module = importlib.import_module("many_templates")
+    loaded = TemplateRegistry.from_module(module)
+    for i in range(n):
+        loaded.get(f"t{i}").get_text({"value": i})
+    assert all(loaded.get_model(name) is model for name, model in module.MODELS.items())
+    assert all(loaded.get(name).get_model() is model for name, model in module.MODELS.items())
+    assert TemplateModel.cache_info().misses == 0
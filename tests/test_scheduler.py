@@ -0,0 +1,182 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from template_models.scheduler import (
+    Priority,
+    RateLimit,
+    RetryPolicy,
+    Scheduler,
+    TokenBucket,
+    _PriorityGate,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+
+
+def test_token_bucket():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=1.0, capacity=2, clock=clock)
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == 0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    ## Reservations queue up behind each other
+    assert bucket.reserve(1) == pytest.approx(2.0)
+    clock.now = 2.0
+    assert bucket.reserve(1) == pytest.approx(1.0)
+    bucket.adjust(1)
+    clock.now = 10.0
+    assert bucket.reserve(2) == 0
+
+
+def test_retry_policy_delay():
+    policy = RetryPolicy(base_delay=1.0, max_delay=4.0)
+    assert all(0 <= policy.delay(attempt) <= 4.0 for attempt in range(10))
+    assert policy.delay(0, retry_after=3.0) >= 3.0
+    assert policy.delay(0, retry_after=100.0) == 4.0
+
+
+def test_priority_gate_serves_interactive_first():
+    gate = _PriorityGate(1)
+    gate.acquire(Priority.BATCH)
+    order = []
+
+    def worker(priority, name):
+        gate.acquire(priority)
+        order.append(name)
+        gate.release()
+
+    threads = [threading.Thread(target=worker, args=(Priority.BATCH, "batch"))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads.append(threading.Thread(target=worker, args=(Priority.INTERACTIVE, "interactive")))
+    threads[1].start()
+    time.sleep(0.05)
+    gate.release()
+    for thread in threads:
+        thread.join(1)
+    assert order == ["interactive", "batch"]
+
+
+def test_scheduler_retries_and_gives_up():
+    calls = []
+
+    def request(model):
+        calls.append(model)
+        raise StatusError(429)
+
+    scheduler = Scheduler(retry=RetryPolicy(max_retries=2, base_delay=0.001))
+    with pytest.raises(StatusError):
+        scheduler.call("m", request)
+    assert calls == ["m", "m", "m"]
+
+
+def test_scheduler_retries_wrapped_errors():
+    calls = []
+
+    def request(model):
+        calls.append(model)
+        if len(calls) == 1:
+            try:
+                raise TimeoutError("slow")
+            except TimeoutError as e:
+                raise RuntimeError("wrapped") from e
+        return "ok"
+
+    scheduler = Scheduler(retry=RetryPolicy(base_delay=0.001))
+    assert scheduler.call("m", request) == "ok"
+    assert len(calls) == 2
+
+
+def test_scheduler_does_not_retry_other_errors():
+    calls = []
+
+    def request(model):
+        calls.append(model)
+        raise StatusError(400)
+
+    with pytest.raises(StatusError):
+        Scheduler().call("m", request)
+    assert calls == ["m"]
+
+
+def test_scheduler_latency_slo_fallback():
+    clock = FakeClock()
+    scheduler = Scheduler(fallbacks={"slow": "fast"}, latency_slo=1.0, slo_window=60, clock=clock)
+
+    def slow_request(model):
+        clock.now += 5.0 if model == "slow" else 0.1
+        return model
+
+    assert scheduler.call("slow", slow_request) == "slow"
+    assert scheduler.slo_breached("slow")
+    assert scheduler.call("slow", slow_request) == "fast"
+    ## Once the slow samples age out, the primary model is tried again
+    clock.now += 61
+    assert scheduler.call("slow", slow_request) == "slow"
+
+
+def test_scheduler_latency_excludes_throttling(monkeypatch):
+    clock = FakeClock()
+
+    def sleep(seconds):
+        clock.now += seconds
+
+    monkeypatch.setattr(time, "sleep", sleep)
+    scheduler = Scheduler(
+        limits={"m": RateLimit(requests_per_minute=60)},
+        retry=RetryPolicy(base_delay=10.0, max_delay=10.0),
+        fallbacks={"m": "fallback"},
+        latency_slo=0.5,
+        clock=clock,
+    )
+    calls = []
+
+    def request(model):
+        calls.append(model)
+        if len(calls) == 1:
+            raise StatusError(429)
+        return model
+
+    ## Waiting for the rate limit and the retry backoff takes seconds, the requests none
+    for _ in range(70):
+        assert scheduler.call("m", request) == "m"
+    assert clock.now > 10
+    assert not scheduler.slo_breached("m")
+
+
+def test_scheduler_token_budget_uses_real_usage():
+    clock = FakeClock()
+    scheduler = Scheduler(limits={"m": RateLimit(tokens_per_minute=60)}, clock=clock)
+    scheduler.call("m", lambda model: 10, tokens=50, usage=lambda tokens: tokens)
+    ## 50 were reserved but only 10 used, so 50 are left
+    assert scheduler._reserve("m", 50) == 0
+    assert scheduler._reserve("m", 1) > 0
+
+
+def test_scheduler_acall():
+    calls = []
+
+    async def request(model):
+        calls.append(model)
+        if len(calls) < 3:
+            raise StatusError(503)
+        return "ok"
+
+    scheduler = Scheduler(retry=RetryPolicy(base_delay=0.001))
+    assert asyncio.run(scheduler.acall("m", request)) == "ok"
+    assert len(calls) == 3
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from template_models import TemplateIndex, TemplateModel, TemplateRegistry
+
+
+@pytest.fixture
+def index():
+    return TemplateIndex(
+        {
+            "person": TemplateModel("Name:<#name|str|Name#> Age:<#age|int|Age#>"),
+            "order": TemplateModel(
+                "Order <#id|int|Id#> for <#customer|str|Customer#>: <#items|list[str]|Items#>"
+            ),
+            "note": TemplateModel("<#text|str|Free text#>"),
+        }
+    )
+
+
+def test_parse_text_round_trip():
+    template = TemplateModel(
+        "{greeting} <#name|str|Name#>, you are <#age|int|Age#>. Bye <#name|str|Name#>. "
+        "Size: <#size|Optional[int]|Size#>. Scores: <#scores|dict[str, float]|Scores#>",
+        substitutions={"greeting": "Hi"},
+    )
+    data = {"name": "Jay", "age": 30, "size": None, "scores": {"a": 1.5, "b": 2.0}}
+    text = template.get_text(data)
+    instance = template.parse_text(text)
+    assert instance is not None
+    assert instance.model_dump() == data
+    assert template.parse_text("Hello Jay, you are 30. Bye Jay. Size: 1. Scores: {}") is None
+    ## A repeated field has to repeat the same value
+    assert template.parse_text("Hi Jay, you are 30. Bye Kay. Size: 1. Scores: {}") is None
+
+
+@pytest.mark.parametrize(
+    "template,data,name",
+    [
+        ("Braces {{x}} name=<#name#> age=<#age|int#>", {"name": "Jay", "age": 30}, "Jay"),
+        ("Hi <#name#> {greet}", {"name": "Jay", "greet": "hello"}, "Jay"),
+    ],
+)
+def test_parse_text_round_trip_without_substitutions(template, data, name):
+    template = TemplateModel(template, delayed_substitution=True)
+    text = template.get_text(data)
+    assert template.parse_text(text).name == name  # type: ignore
+    match = TemplateIndex({"t": template}).match(text)
+    assert match is not None and match.instance.name == name  # type: ignore
+
+
+def test_parse_text_fields_end_at_the_next_literal():
+    template = TemplateModel("<#a#> <#b#> END", delayed_substitution=True)
+    instance = template.parse_text("x y z END")
+    assert (instance.a, instance.b) == ("x", "y z")  # type: ignore
+
+
+def test_parse_text_non_matching_fails_quickly():
+    template = TemplateModel(" ".join(f"<#f{i}#>" for i in range(10)) + " END")
+    text = " ".join(["word"] * 40) + " XXX"
+    start = time.perf_counter()
+    assert template.parse_text(text) is None
+    assert TemplateIndex({"t": template}).match(text) is None
+    assert time.perf_counter() - start < 1
+
+
+def test_parse_text_delayed_substitution():
+    template = TemplateModel("{var} Name:<#name|str|Name#>", delayed_substitution=True)
+    assert template.parse_text("{var} Name:Jay").name == "Jay"  # type: ignore
+    instance = template.parse_text("Value Name:Jay", substitutions={"var": "Value"})
+    assert instance.name == "Jay"  # type: ignore
+
+
+def test_index_match(index):
+    match = index.match("Order 7 for Ann: ['a', 'b']")
+    assert match.name == "order"
+    assert match.instance.items == ["a", "b"]
+    match = index.match("Name:Jay Age:30")
+    assert (match.name, match.instance.age) == ("person", 30)
+    ## Fits the person template's shape but not its types, so the catch-all wins
+    match = index.match("Name:Jay Age:old")
+    assert match.name == "note"
+    assert TemplateIndex().match("anything") is None
+
+
+def test_index_from_registry():
+    registry = TemplateRegistry({"greeting": {"template": "Hello <#name|str|Name#>!"}})
+    index = TemplateIndex.from_registry(registry)
+    assert "greeting" in index
+    assert index.match("Hello Ann!").instance.name == "Ann"
+    assert index.match("Bye Ann!") is None
+
+
+def test_index_llm_fallback():
+    index = TemplateIndex({"person": TemplateModel("Name:<#name|str|Name#> Age:<#age|int|Age#>")})
+
+    def create(model, messages, response_model, **kwargs):
+        assert messages[-1]["content"] == "Jay is 30"
+        return response_model(name="Jay", age=30)
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    assert index.extract("Jay is 30") is None
+    match = index.extract("Jay is 30", fallback="person", llm=client)
+    assert (match.name, match.instance.age) == ("person", 30)
+
+    async def acreate(**kwargs):
+        return create(**kwargs)
+
+    async_client = SimpleNamespace(
+        chat=SimpleNamespace(completions=SimpleNamespace(create=acreate))
+    )
+    match = asyncio.run(index.aextract("Jay is 30", fallback="person", llm=async_client))
+    assert match.instance.name == "Jay"
@@ -1,5 +1,16 @@
+import io
+import json
+import mmap
+import pickle
+import subprocess
+import sys
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import FrozenInstanceError
+
 import pytest
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationError
 from template_models.template_model import TemplateModel
 
 
@@ -123,6 +134,371 @@ def test_doc_name_on_get_model():
     assert model.__name__ == "MyModel"
 
 
+def test_get_model_is_cached(name_age):
+    TemplateModel.clear_cache()
+    text_generator = TemplateModel(name_age)
+    model = text_generator.get_model()
+    assert text_generator.get_model() is model
+    info = TemplateModel.cache_info()
+    assert info.hits == 1
+    assert info.misses == 1
+
+
+def test_get_model_cache_keyed_on_substitutions():
+    text_generator = TemplateModel(
+        "Var1:{var1} Name:<#name#>",
+        descriptions={"name": "Name for {var1}"},
+        delayed_substitution=True,
+    )
+    model1 = text_generator.get_model(substitutions={"var1": "a"})
+    model2 = text_generator.get_model(substitutions={"var1": "b"})
+    assert model1 is not model2
+    assert model1.model_fields["name"].description == "Name for a"
+    assert model2.model_fields["name"].description == "Name for b"
+    assert text_generator.get_model(substitutions={"var1": "a"}) is model1
+
+
+def test_get_model_cache_keyed_on_class_name_and_doc(name_age):
+    text_generator = TemplateModel(name_age)
+    assert text_generator.get_model(class_name="A") is not text_generator.get_model(class_name="B")
+    assert text_generator.get_model(class_doc="A") is not text_generator.get_model(class_doc="B")
+
+
+def test_model_cache_eviction():
+    from template_models.model_cache import ModelCache
+
+    cache = ModelCache(maxsize=2)
+    for i in range(3):
+        cache.get_or_create(i, lambda: BaseModel)
+    info = cache.info()
+    assert info.currsize == 2
+    assert info.evictions == 1
+    assert 0 not in cache
+    cache.clear()
+    assert cache.info() == ModelCache(maxsize=2).info()
+
+
+def test_get_texts(name_age):
+    rows = [{"name": "Jay", "age": 30}, {"name": "Kay", "age": 31}]
+    text_generator = TemplateModel(name_age)
+    assert text_generator.get_texts(rows) == ["Name:Jay Age:30", "Name:Kay Age:31"]
+
+
+def test_get_texts_with_sub_fields(name_age_with_sub_fields):
+    rows = [{"name": "Jay", "age": 30}]
+    text_generator = TemplateModel(name_age_with_sub_fields, delayed_substitution=True)
+    assert text_generator.get_texts(rows, substitutions={"var1": "Value1"}) == [
+        "Var1:Value1 Name:Jay Age:30"
+    ]
+
+
+def test_get_texts_collects_errors(name_age):
+    rows = [{"name": "Jay", "age": 30}, {"name": "Kay", "age": "old"}, {"name": "May", "age": 5}]
+    errors = []
+    text_generator = TemplateModel(name_age)
+    texts = text_generator.get_texts(rows, errors=errors, batch_size=2)
+    assert texts == ["Name:Jay Age:30", None, "Name:May Age:5"]
+    assert [index for index, _ in errors] == [1]
+
+
+def test_get_texts_lazy(name_age):
+    rows = ({"name": "Jay", "age": i} for i in range(5))
+    text_generator = TemplateModel(name_age)
+    texts = text_generator.get_texts(rows, lazy=True, batch_size=2)
+    assert next(texts) == "Name:Jay Age:0"
+    assert list(texts)[-1] == "Name:Jay Age:4"
+
+
+def test_get_model_per_tenant_descriptions():
+    text_generator = TemplateModel(
+        "Customer {customer}: <#name|str|Contact name at {customer}#> <#age|int#>",
+        class_doc="Contact for {customer}",
+        delayed_substitution=True,
+    )
+    models = [text_generator.get_model(substitutions={"customer": f"C{i}"}) for i in range(3)]
+    assert len({id(m) for m in models}) == 3
+    assert models[1].model_fields["name"].description == "Contact name at C1"
+    assert models[1].__doc__ == "Contact for C1"
+    assert list(models[2].model_fields) == ["name", "age"]
+    assert models[2].model_fields["age"].annotation is int
+
+
+def test_get_model_placeholder_in_field_name():
+    text_generator = TemplateModel("<#{prefix}_name#>", delayed_substitution=True)
+    model = text_generator.get_model(substitutions={"prefix": "user"})
+    assert list(model.model_fields) == ["user_name"]
+
+
+def test_get_model_substitution_inserts_fields():
+    text_generator = TemplateModel("A {x} <#name#>", delayed_substitution=True)
+    assert list(text_generator.get_model().model_fields) == ["name"]
+    model = text_generator.get_model(substitutions={"x": "<#age|int|Age#>"})
+    assert list(model.model_fields) == ["age", "name"]
+
+
+def test_get_model_missing_substitution_raises():
+    text_generator = TemplateModel("{missing} <#name#>")
+    with pytest.raises(KeyError):
+        text_generator.get_model()
+
+
+def test_iter_text(name_age_with_sub_fields):
+    data = {"name": "Jay", "age": 30}
+    text_generator = TemplateModel(name_age_with_sub_fields, substitutions={"var1": "Value1"})
+    chunks = list(text_generator.iter_text(data))
+    assert len(chunks) > 1
+    assert "".join(chunks) == text_generator.get_text(data)
+    instance = text_generator.get_instance(data)
+    assert "".join(text_generator.iter_text(instance)) == "Var1:Value1 Name:Jay Age:30"
+
+
+def test_render_to_text_and_binary(name_age):
+    text_generator = TemplateModel(name_age)
+    text_writer = io.StringIO()
+    text_generator.render_to(text_writer, {"name": "Jäy", "age": 30})
+    assert text_writer.getvalue() == "Name:Jäy Age:30"
+
+    raw = io.BytesIO()
+    binary_writer = io.BufferedWriter(raw)  # type: ignore
+    text_generator.render_to(binary_writer, {"name": "Jäy", "age": 30})
+    binary_writer.flush()
+    assert raw.getvalue() == "Name:Jäy Age:30".encode()
+
+
+def test_render_many_to(name_age, tmp_path):
+    rows = [{"name": "Jay", "age": 30}, {"name": "Kay", "age": "old"}, {"name": "May", "age": 5}]
+    errors = []
+    text_generator = TemplateModel(name_age)
+    path = tmp_path / "out.txt"
+    with open(path, "wb") as f:
+        written = text_generator.render_many_to(f, rows, errors=errors, batch_size=2)
+    assert written == 2
+    assert [index for index, _ in errors] == [1]
+    assert path.read_text() == "Name:Jay Age:30\nName:May Age:5\n"
+
+
+def test_spec_round_trip(name_age_with_sub_fields):
+    text_generator = TemplateModel(name_age_with_sub_fields, substitutions={"var1": "{{x}}"})
+    rebuilt = TemplateModel.from_spec(text_generator.to_spec())
+    assert rebuilt == text_generator
+
+
+def test_render_parallel(name_age):
+    rows = [{"name": f"P{i}", "age": i} for i in range(25)] + [{"name": "Bad", "age": "old"}]
+    text_generator = TemplateModel(name_age)
+    texts = list(text_generator.render_parallel(rows, workers=2, chunksize=4))
+    assert texts == text_generator.get_texts(rows)
+
+
+def test_render_parallel_shards(name_age, tmp_path):
+    rows = [{"name": f"P{i}", "age": i} for i in range(10)]
+    text_generator = TemplateModel(name_age)
+    paths = text_generator.render_parallel(rows, workers=2, chunksize=4, output_dir=tmp_path)
+    assert [p.name for p in paths] == ["part-00000.txt", "part-00001.txt", "part-00002.txt"]  # type: ignore
+    text = "".join(p.read_text() for p in paths)  # type: ignore
+    assert text == "".join(t + "\n" for t in text_generator.get_texts(rows))  # type: ignore
+
+
+def test_get_text_without_validation(name_age_with_sub_fields):
+    data = {"name": "Jay", "age": 30}
+    text_generator = TemplateModel(name_age_with_sub_fields, substitutions={"var1": "Value1"})
+    expected = text_generator.get_text(data)
+    instance = text_generator.get_instance({"name": "Jay", "age": "thirty"}, validate=False)
+    assert instance.age == "thirty"  # type: ignore
+    assert text_generator.get_text(data, validate=False) == expected
+    assert text_generator.get_text_from_dict(data) == expected
+
+
+def test_get_texts_sampled_validation(name_age):
+    rows = [{"name": f"P{i}", "age": i} for i in range(6)]
+    rows[0]["age"] = "old"
+    rows[1]["age"] = "older"
+    errors = []
+    text_generator = TemplateModel(name_age)
+    texts = text_generator.get_texts(rows, validate=False, sample_every=3, errors=errors)
+    ## Row 0 is sampled and fails, row 1 is not sampled and is rendered as given
+    assert texts[0] is None
+    assert texts[1] == "Name:P1 Age:older"
+    assert texts[2:] == text_generator.get_texts(rows[2:])
+    assert [index for index, _ in errors] == [0]
+
+
+def test_get_text_from_json(name_age_with_sub_fields):
+    text_generator = TemplateModel(name_age_with_sub_fields, substitutions={"var1": "Value1"})
+    expected = text_generator.get_text({"name": "Jay", "age": 30})
+    assert text_generator.get_text_from_json(b'{"name": "Jay", "age": 30}') == expected
+    assert text_generator.get_text_from_json('{"name": "Jay", "age": "30"}') == expected
+    with pytest.raises(ValidationError):
+        text_generator.get_text_from_json(b'{"name": "Jay", "age": "old"}')
+
+
+def test_get_text_from_json_keeps_extra_keys():
+    text_generator = TemplateModel("Hi {customer}: <#name|str|N#>", delayed_substitution=True)
+    record = {"name": "a", "customer": "C"}
+    expected = text_generator.get_text(record)
+    assert expected == "Hi C: a"
+    assert text_generator.get_text_from_json(json.dumps(record)) == expected
+    assert text_generator.get_texts_from_jsonl(json.dumps(record)) == [expected]
+    assert text_generator.get_text_from_json('{"name": "a"}') == "Hi {customer}: a"
+
+
+def test_get_texts_from_jsonl(name_age, tmp_path):
+    lines = b'{"name": "Jay", "age": 30}\n\n{"name": "Kay", "age": "old"}\n{"name": "May", "age": 5}'
+    expected = ["Name:Jay Age:30", None, "Name:May Age:5"]
+    text_generator = TemplateModel(name_age)
+    errors = []
+    assert text_generator.get_texts_from_jsonl(lines, errors=errors) == expected
+    assert [index for index, _ in errors] == [1]
+    assert text_generator.get_texts_from_jsonl(lines.decode()) == expected
+
+    path = tmp_path / "rows.jsonl"
+    path.write_bytes(lines)
+    with open(path, "rb") as f:
+        assert text_generator.get_texts_from_jsonl(f) == expected
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            assert list(text_generator.get_texts_from_jsonl(mm, lazy=True)) == expected
+
+
+def test_to_columns(name_age_with_sub_fields):
+    rows = [{"name": "Jay", "age": 30}, {"name": "Kay", "age": "old"}, {"name": "May", "age": "5"}]
+    text_generator = TemplateModel(name_age_with_sub_fields, substitutions={"var1": "Value1"})
+    errors = []
+    columns = text_generator.to_columns(rows, errors=errors, batch_size=2)
+    assert columns == {"name": ["Jay", "May"], "age": array("q", [30, 5])}
+    assert [index for index, _ in errors] == [1]
+    expected = [text for text in text_generator.get_texts(rows) if text is not None]
+    assert text_generator.render_columns(columns) == expected
+
+
+def test_to_columns_big_ints():
+    text_generator = TemplateModel("<#n|int|N#> <#s|str|S#>")
+    rows = [{"n": 1, "s": "a"}, {"n": 2**70, "s": "b"}, {"n": 3, "s": "c"}]
+    columns = text_generator.to_columns(rows, batch_size=2)
+    assert columns == {"n": [1, 2**70, 3], "s": ["a", "b", "c"]}
+    assert text_generator.render_columns(columns) == text_generator.get_texts(rows)
+
+
+def test_render_columns_fills_sub_fields_from_columns():
+    text_generator = TemplateModel(
+        "<#n|int|A number#> is {n:03d} {unknown}", delayed_substitution=True
+    )
+    columns = text_generator.to_columns([{"n": 7}, {"n": 42}])
+    assert text_generator.render_columns(columns) == ["7 is 007 {unknown}", "42 is 042 {unknown}"]
+
+
+def test_to_columns_from_jsonl(name_age):
+    lines = b'{"name": "Jay", "age": 30}\n\n{"name": "Kay", "age": "old"}\n{"name": "May", "age": 5}'
+    text_generator = TemplateModel(name_age)
+    errors = []
+    columns = text_generator.to_columns_from_jsonl(lines, errors=errors)
+    assert columns == {"name": ["Jay", "May"], "age": array("q", [30, 5])}
+    assert [index for index, _ in errors] == [1]
+
+
+def test_columns_to_arrow(name_age):
+    pa = pytest.importorskip("pyarrow")
+    from template_models.columnar import to_arrow
+
+    columns = TemplateModel(name_age).to_columns([{"name": "Jay", "age": 30}])
+    table = to_arrow(columns)
+    assert table.schema.field("age").type == pa.int64()
+    assert table.to_pylist() == [{"name": "Jay", "age": 30}]
+
+
+def test_fingerprint(name_age):
+    text_generator = TemplateModel(name_age)
+    assert text_generator.fingerprint() == TemplateModel(name_age).fingerprint()
+    assert text_generator.class_name == TemplateModel(name_age).class_name
+    assert text_generator.class_name.startswith("DynamicModel_")  # type: ignore
+    assert text_generator.fingerprint() != TemplateModel(name_age, class_doc="Doc").fingerprint()
+    assert (
+        text_generator.fingerprint()
+        != TemplateModel(name_age, descriptions={"name": "Other"}).fingerprint()
+    )
+    named = TemplateModel(name_age, class_name="Person")
+    assert named.fingerprint() != text_generator.fingerprint()
+    assert named.fingerprint() == TemplateModel(name_age, class_name="Person").fingerprint()
+    assert TemplateModel.from_spec(named.to_spec()).fingerprint() == named.fingerprint()
+
+
+def test_fingerprint_is_stable_across_processes(name_age):
+    code = (
+        "from template_models import TemplateModel;"
+        f"t = TemplateModel({name_age!r});"
+        "print(t.fingerprint(), t.get_model().model_json_schema()['title'])"
+    )
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True
+        ).stdout
+        for _ in range(2)
+    }
+    text_generator = TemplateModel(name_age)
+    assert outputs == {f"{text_generator.fingerprint()} {text_generator.class_name}\n"}
+
+
+def test_fingerprint_follows_nested_types():
+    person = TemplateModel("<#name|str|Name#>", class_name="Person")
+    other = TemplateModel("<#name|str|Full name#>", class_name="Person")
+    template = "<#author|person|Author#>"
+    assert (
+        TemplateModel(template, types={"person": person}).fingerprint()
+        != TemplateModel(template, types={"person": other}).fingerprint()
+    )
+    ## Names the template doesn't use don't count
+    assert (
+        TemplateModel(template, types={"person": person}).fingerprint()
+        == TemplateModel(template, types={"person": person, "unused": other}).fingerprint()
+    )
+
+
+def test_freeze(name_age_with_sub_fields):
+    text_generator = TemplateModel(name_age_with_sub_fields, substitutions={"var1": "Value1"})
+    fingerprint = text_generator.fingerprint()
+    frozen = TemplateModel(name_age_with_sub_fields, substitutions={"var1": "Value1"}).freeze()
+    assert frozen.frozen and not text_generator.frozen
+    assert frozen == text_generator
+    assert frozen.fingerprint() == fingerprint
+    assert frozen.get_model() is text_generator.get_model()
+    assert frozen.get_text({"name": "Jay", "age": 30}) == "Var1:Value1 Name:Jay Age:30"
+    with pytest.raises(FrozenInstanceError):
+        frozen.template = "Name:<#name#>"
+    with pytest.raises(TypeError):
+        frozen.substitutions["var1"] = "Other"  # type: ignore
+
+    restored = pickle.loads(pickle.dumps(frozen))
+    assert restored.frozen and restored == frozen
+    assert pickle.loads(pickle.dumps(frozen.to_spec())) == text_generator.to_spec()
+
+
+def test_frozen_template_renders_from_many_threads():
+    n_threads = 8
+    template = TemplateModel(
+        "{greeting} <#name|str|The name#>, you are <#age|int|The age#> ({age})",
+        substitutions={"greeting": "Hello"},
+        delayed_substitution=True,
+    ).freeze()
+    TemplateModel.clear_cache()
+    barrier = threading.Barrier(n_threads)
+
+    def work(thread_id: int) -> tuple[type[BaseModel], list[str]]:
+        ## Every thread asks for the model at once, so the lazy initialization races
+        barrier.wait()
+        model = template.get_model()
+        texts = [template.get_text({"name": f"T{thread_id}", "age": i}) for i in range(200)]
+        texts += template.get_texts([{"name": f"T{thread_id}", "age": i} for i in range(200)])
+        return model, texts
+
+    with ThreadPoolExecutor(n_threads) as pool:
+        results = list(pool.map(work, range(n_threads)))
+
+    assert len({model for model, _ in results}) == 1
+    assert TemplateModel.cache_info().misses == 1
+    for thread_id, (_, texts) in enumerate(results):
+        expected = [f"Hello T{thread_id}, you are {i} ({i})" for i in range(200)]
+        assert texts == expected + expected
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-k", "", "-W", "ignore:Module already imported:pytest.PytestWarning"])
     # pytest.main([ __file__ ,"-k", "test_descriptions", "-W", "ignore:Module already imported:pytest.PytestWarning"])
@@ -133,5 +509,3 @@ if __name__ == "__main__":
     #     age: int = Field(30, description="This is the age field")
     # from pprint import pprint
     # pprint(generate_tool_schema(MyModel))
-
-
@@ -0,0 +1,152 @@
+import datetime
+import pickle
+from typing import Literal, Optional, Union
+
+import pytest
+from pydantic import ValidationError
+
+from template_models import TemplateModel, TemplateRegistry
+from template_models.type_parser import (
+    TypeCycleError,
+    TypeSyntaxError,
+    parse_type_expr,
+    resolve_type,
+)
+
+
+@pytest.mark.parametrize(
+    "type_str,expected",
+    [
+        ("int", int),
+        ("list[int]", list[int]),
+        ("List[str]", list[str]),
+        ("dict[str, float]", dict[str, float]),
+        ("tuple[int, ...]", tuple[int, ...]),
+        ("Optional[float]", Optional[float]),
+        ("int | None", Optional[int]),
+        ("Union[int, str]", Union[int, str]),
+        ("Literal['a', 'b']", Literal["a", "b"]),
+        ("date", datetime.date),
+        ("list[dict[str, int | None]]", list[dict[str, Optional[int]]]),
+    ],
+)
+def test_resolve_type(type_str, expected):
+    assert resolve_type(type_str) == expected
+
+
+@pytest.mark.parametrize("type_str", ["", None, "The name of the person", "list[", "foo[int]"])
+def test_resolve_type_falls_back_to_str(type_str):
+    assert resolve_type(type_str) is str
+
+
+def test_parse_type_expr_errors():
+    with pytest.raises(TypeSyntaxError):
+        parse_type_expr("list[int")
+    with pytest.raises(TypeSyntaxError):
+        parse_type_expr("list[int] str")
+    assert resolve_type("Literal[int]") is str
+
+
+def test_two_part_specs_keep_legacy_types():
+    template = TemplateModel(
+        template="<#when|time#> <#nothing|None#> <#tags|list[int]#> <#at|time|At#>"
+    )
+    fields = template.get_model().model_fields
+    assert fields["when"].annotation is str
+    assert fields["when"].description == "time"
+    assert fields["nothing"].annotation is str
+    assert fields["tags"].annotation == list[int]
+    assert fields["at"].annotation is datetime.time
+    assert resolve_type("time", extended=False) is str
+
+
+def test_registry_type_resolution_is_cached_and_invalidated(monkeypatch):
+    from template_models import type_parser
+
+    registry = TemplateRegistry(
+        {
+            "person": {"template": "<#name|str|Name#>"},
+            "book": {"template": "<#title|str|Title#> <#author|person|Author#>"},
+        }
+    )
+    book = registry.get("book")
+    model = book.get_model()
+    calls = []
+    monkeypatch.setattr(type_parser, "_resolve", lambda *args: calls.append(args))
+    assert book.get_model() is model
+    assert calls == []
+    monkeypatch.undo()
+
+    registry.register("person", {"template": "<#name|str|Name#> <#age|int|Age#>"})
+    author = book.get_model().model_fields["author"].annotation
+    assert list(author.model_fields) == ["name", "age"]
+
+
+def test_recursive_template_types_raise():
+    registry = TemplateRegistry({"node": {"template": "<#children|list[node]|Children#>"}})
+    with pytest.raises(TypeCycleError, match="node -> node"):
+        registry.get_model("node")
+    registry = TemplateRegistry(
+        {"a": {"template": "<#b|b|B#>"}, "b": {"template": "<#a|Optional[a]|A#>"}}
+    )
+    with pytest.raises(TypeCycleError, match="b -> a -> b"):
+        registry.get_model("a")
+
+
+def test_recursive_template_types_fingerprint_raises():
+    registry = TemplateRegistry({"node": {"template": "<#child|Optional[node]|C#>"}})
+    with pytest.raises(TypeCycleError, match="node -> node"):
+        registry.get("node").fingerprint()
+    with pytest.raises(TypeCycleError, match="node -> node"):
+        TemplateModel("<#x|node|X#>", types=registry)
+
+
+def test_parameterized_field_types():
+    template = TemplateModel(
+        template="<#tags|list[str]|Tags#> <#score|float | None|Score#> <#kind|Literal['a', 'b']|Kind#> <#when|date|When#>"
+    )
+    model = template.get_model()
+    assert model.model_fields["tags"].annotation == list[str]
+    assert model.model_fields["score"].annotation == Optional[float]
+    instance = model(tags=["x"], score=None, kind="a", when="2024-01-02")
+    assert instance.when == datetime.date(2024, 1, 2)
+    with pytest.raises(ValidationError):
+        model(tags=["x"], score=None, kind="c", when="2024-01-02")
+
+
+def test_nested_template_from_types():
+    person = TemplateModel(template="<#name|str|Name#> <#age|int|Age#>", class_name="Person")
+    template = TemplateModel(
+        template="<#title|str|Title#> by <#authors|list[person]|Authors#>", types={"person": person}
+    )
+    model = template.get_model()
+    instance = model(title="Book", authors=[{"name": "Ann", "age": 3}])
+    assert instance.authors[0].age == 3
+    assert model.model_fields["authors"].annotation == list[person.get_model()]
+
+
+def test_nested_template_from_registry(tmp_path, monkeypatch):
+    registry = TemplateRegistry(
+        {
+            "person": {"template": "<#name|str|Name#>"},
+            "book": {"template": "<#title|str|Title#> <#author|person|Author#> <#editor|Optional[person]|Editor#>"},
+        }
+    )
+    model = registry.get_model("book")
+    instance = model(title="Book", author={"name": "Ann"}, editor=None)
+    assert type(instance.author).__name__ == "Person"
+
+    path = registry.compile(tmp_path / "compiled_nested.py")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    loaded = TemplateRegistry.from_module("compiled_nested")
+    compiled = loaded.get_model("book")
+    assert compiled.__module__ == "compiled_nested"
+    assert compiled(title="Book", author={"name": "Ann"}, editor={"name": "Bo"}).editor.name == "Bo"
+    assert path.exists()
+
+
+def test_registry_template_is_picklable():
+    registry = TemplateRegistry({"person": {"template": "<#name|str|Name#>"}})
+    template = registry.get("person")
+    restored = pickle.loads(pickle.dumps(template))
+    assert restored.get_text({"name": "Ann"}) == "Ann"